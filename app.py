@@ -11,9 +11,24 @@ import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
-import numpy as np
 from datetime import datetime
 import hashlib
+import uuid
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from correlation import CorrelationTracker, state_path as correlation_state_path
+from drift import GapDriftDetector, gap_features, state_path as drift_state_path
+from event_log import EventLog
+from profiling import is_admin, profile_rerun, should_profile
+from scoring import (
+    SOFT_QUESTIONS, HARD_QUESTIONS, QUADRANT_DEFINITIONS, QUESTION_INDEX, N_QUESTIONS,
+    calculate_scores, determine_quadrant, calculate_gap_analysis, encode_responses, get_answer,
+    gap_level, answers_matrix,
+)
+from recommendations import build_features, get_engine
+from scoring_rules import get_rules
+from screening import describe_flags, screen_one, screen_pair
+from session_memory import session_memory_report
 
 # ページ設定
 st.set_page_config(
@@ -74,213 +89,34 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 質問データの定義（拡充版）
-SOFT_QUESTIONS = [
-    {
-        "id": "soft_1",
-        "category": "人材定着",
-        "question": "職員間のコミュニケーションは活発ですか？",
-        "description": "日常的な会話、情報共有、相談のしやすさを評価"
-    },
-    {
-        "id": "soft_2",
-        "category": "人材定着",
-        "question": "退職理由のヒアリング・記録を行っていますか？",
-        "description": "退職者への面談実施と記録の有無を評価"
-    },
-    {
-        "id": "soft_3",
-        "category": "育成",
-        "question": "新人職員への教育体制は整っていますか？",
-        "description": "OJT計画、マニュアル、メンター制度の有無を評価"
-    },
-    {
-        "id": "soft_4",
-        "category": "育成",
-        "question": "管理者のマネジメント能力は十分ですか？",
-        "description": "経営数字の理解、部下育成、方針の翻訳力を評価"
-    },
-    {
-        "id": "soft_5",
-        "category": "理念",
-        "question": "法人の理念・ビジョンは職員に浸透していますか？",
-        "description": "理念の説明機会、日常業務への反映度を評価"
-    },
-    {
-        "id": "soft_6",
-        "category": "コミュニケーション",
-        "question": "経営者と現場職員が直接会話する機会はありますか？",
-        "description": "経営層と現場の接点頻度を評価"
-    },
-    {
-        "id": "soft_7",
-        "category": "コミュニケーション",
-        "question": "職員が上司に「言いにくいこと」を言える環境ですか？",
-        "description": "心理的安全性、1on1面談、匿名アンケートの有無を評価"
-    },
-]
-
-HARD_QUESTIONS = [
-    {
-        "id": "hard_1",
-        "category": "人員基準",
-        "question": "人員配置基準を常に満たしていますか？",
-        "description": "常勤換算の計算、基準遵守状況を評価"
-    },
-    {
-        "id": "hard_2",
-        "category": "人員基準",
-        "question": "サービス管理責任者の配置は適正ですか？",
-        "description": "資格要件、配置基準の遵守を評価"
-    },
-    {
-        "id": "hard_3",
-        "category": "記録",
-        "question": "個別支援計画は定期的に更新されていますか？",
-        "description": "6ヶ月ごとの見直し、モニタリング記録を評価"
-    },
-    {
-        "id": "hard_4",
-        "category": "記録",
-        "question": "サービス提供記録は適切に作成されていますか？",
-        "description": "当日記録、内容の正確性、保管状況を評価"
-    },
-    {
-        "id": "hard_5",
-        "category": "安全管理",
-        "question": "虐待防止委員会は設置・運営されていますか？",
-        "description": "委員会設置、定期開催、研修実施を評価"
-    },
-    {
-        "id": "hard_6",
-        "category": "安全管理",
-        "question": "BCP（業務継続計画）は策定・訓練されていますか？",
-        "description": "BCP策定、年1回以上の訓練実施を評価"
-    },
-    {
-        "id": "hard_7",
-        "category": "加算管理",
-        "question": "取得可能な加算を把握・算定できていますか？",
-        "description": "加算要件の理解、算定漏れの有無を評価"
-    },
-]
-
-# 象限の定義
-QUADRANT_DEFINITIONS = {
-    "ホワイト優良経営": {
-        "description": "組織も法令遵守も高水準。継続的な改善で更なる成長を。",
-        "color": "#38A169",
-        "recommendation": "現状維持しつつ、次のステージへの投資を検討してください。"
-    },
-    "砂上の楼閣": {
-        "description": "収益は上がっているが、人が離れるリスクあり。",
-        "color": "#ECC94B",
-        "recommendation": "組織マネジメントの強化が急務です。一斉退職リスクに注意。"
-    },
-    "万年貧乏": {
-        "description": "人は良いが、稼げていない・記録不備のリスクあり。",
-        "color": "#ED8936",
-        "recommendation": "加算取得の最適化、記録体制の整備を優先してください。"
-    },
-    "崩壊寸前": {
-        "description": "組織・法令の両面で危機的状況。即時介入が必要。",
-        "color": "#E53E3E",
-        "recommendation": "専門家への相談を強く推奨します。優先順位を付けた改善を。"
-    }
-}
-
 
 def generate_session_id():
-    """診断セッションIDを生成"""
+    """診断セッションIDを生成（アーカイブで経営者・管理者の回答を結び付けるキーになるため一意にする）"""
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    return f"DIAG-{timestamp}"
-
-
-def calculate_scores(responses: dict) -> dict:
-    """回答からスコアを計算"""
-    soft_scores = []
-    hard_scores = []
-    
-    category_scores = {
-        "人材定着": [],
-        "育成": [],
-        "理念": [],
-        "コミュニケーション": [],
-        "人員基準": [],
-        "記録": [],
-        "安全管理": [],
-        "加算管理": []
-    }
-    
-    for q in SOFT_QUESTIONS:
-        score = responses.get(q["id"], 3)
-        soft_scores.append(score)
-        if q["category"] in category_scores:
-            category_scores[q["category"]].append(score)
-    
-    for q in HARD_QUESTIONS:
-        score = responses.get(q["id"], 3)
-        hard_scores.append(score)
-        if q["category"] in category_scores:
-            category_scores[q["category"]].append(score)
-    
-    # 各カテゴリの平均を計算
-    radar_scores = {}
-    for cat, scores in category_scores.items():
-        radar_scores[cat] = np.mean(scores) if scores else 0
-    
-    # 総合スコア（100点満点に変換）
-    soft_total = (np.mean(soft_scores) / 5) * 100 if soft_scores else 0
-    hard_total = (np.mean(hard_scores) / 5) * 100 if hard_scores else 0
-    
-    return {
-        "soft_score": soft_total,
-        "hard_score": hard_total,
-        "radar_scores": radar_scores,
-        "soft_raw": soft_scores,
-        "hard_raw": hard_scores
-    }
+    return f"DIAG-{timestamp}-{uuid.uuid4().hex}"
 
 
-def determine_quadrant(soft_score: float, hard_score: float) -> str:
-    """スコアから象限を判定"""
-    threshold = 60  # 60点を境界とする
-    
-    if soft_score >= threshold and hard_score >= threshold:
-        return "ホワイト優良経営"
-    elif soft_score < threshold and hard_score >= threshold:
-        return "砂上の楼閣"
-    elif soft_score >= threshold and hard_score < threshold:
-        return "万年貧乏"
-    else:
-        return "崩壊寸前"
+@st.cache_resource
+def get_event_log() -> EventLog:
+    """診断イベントログ（プロセス共有）"""
+    return EventLog()
 
 
-def calculate_gap_analysis(exec_responses: dict, mgr_responses: dict) -> pd.DataFrame:
-    """経営者と管理者の回答ギャップを分析"""
-    all_questions = SOFT_QUESTIONS + HARD_QUESTIONS
-    gaps = []
-    
-    for q in all_questions:
-        qid = q["id"]
-        exec_score = exec_responses.get(qid, 3)
-        mgr_score = mgr_responses.get(qid, 3)
-        gap = exec_score - mgr_score
-        
-        q_type = "Soft" if qid.startswith("soft") else "Hard"
-        
-        gaps.append({
-            "id": qid,
-            "category": q["category"],
-            "question": q["question"],
-            "type": q_type,
-            "executive_score": exec_score,
-            "manager_score": mgr_score,
-            "gap": gap,
-            "abs_gap": abs(gap)
-        })
-    
-    return pd.DataFrame(gaps)
+def log_event(event_type: str, **fields):
+    """診断イベントを記録（書き込みはバックグラウンドでまとめて行う）"""
+    get_event_log().append(event_type, browser_session=runtime_session_id(), **fields)
+
+
+@st.cache_resource
+def get_drift_detector() -> GapDriftDetector:
+    """プロセス全体で共有するギャップのドリフト検知器"""
+    return GapDriftDetector(drift_state_path())
+
+
+@st.cache_resource
+def get_correlation_tracker() -> CorrelationTracker:
+    """プロセス全体で共有する質問・カテゴリ間の相関"""
+    return CorrelationTracker(correlation_state_path())
 
 
 def create_quadrant_chart(soft_score: float, hard_score: float, 
@@ -288,20 +124,22 @@ def create_quadrant_chart(soft_score: float, hard_score: float,
     """4象限リスクマトリクスを作成（デュアル対応）"""
     fig = go.Figure()
     
+    threshold = get_rules().quadrant_threshold
+    
     # 背景の象限を描画
-    fig.add_shape(type="rect", x0=0, y0=0, x1=60, y1=60,
+    fig.add_shape(type="rect", x0=0, y0=0, x1=threshold, y1=threshold,
                   fillcolor="rgba(229, 62, 62, 0.3)", line=dict(width=0))
-    fig.add_shape(type="rect", x0=60, y0=0, x1=100, y1=60,
+    fig.add_shape(type="rect", x0=threshold, y0=0, x1=100, y1=threshold,
                   fillcolor="rgba(236, 201, 75, 0.3)", line=dict(width=0))
-    fig.add_shape(type="rect", x0=0, y0=60, x1=60, y1=100,
+    fig.add_shape(type="rect", x0=0, y0=threshold, x1=threshold, y1=100,
                   fillcolor="rgba(237, 137, 54, 0.3)", line=dict(width=0))
-    fig.add_shape(type="rect", x0=60, y0=60, x1=100, y1=100,
+    fig.add_shape(type="rect", x0=threshold, y0=threshold, x1=100, y1=100,
                   fillcolor="rgba(56, 161, 105, 0.3)", line=dict(width=0))
     
     # 境界線
-    fig.add_shape(type="line", x0=60, y0=0, x1=60, y1=100,
+    fig.add_shape(type="line", x0=threshold, y0=0, x1=threshold, y1=100,
                   line=dict(color="gray", width=2, dash="dash"))
-    fig.add_shape(type="line", x0=0, y0=60, x1=100, y1=60,
+    fig.add_shape(type="line", x0=0, y0=threshold, x1=100, y1=threshold,
                   line=dict(color="gray", width=2, dash="dash"))
     
     # 象限ラベル
@@ -486,6 +324,31 @@ def create_radar_chart(radar_scores: dict) -> go.Figure:
     return fig
 
 
+def create_correlation_heatmap(matrix: pd.DataFrame, title: str,
+                               x_title: str = None, y_title: str = None) -> go.Figure:
+    """相関行列のヒートマップを作成"""
+    fig = go.Figure(data=go.Heatmap(
+        z=matrix.to_numpy(),
+        x=list(matrix.columns),
+        y=list(matrix.index),
+        zmin=-1,
+        zmax=1,
+        colorscale='RdBu',
+        reversescale=True,
+        hovertemplate='%{y} × %{x}<br>相関: %{z:.2f}<extra></extra>'
+    ))
+    
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_title,
+        yaxis_title=y_title,
+        yaxis=dict(autorange='reversed'),
+        height=650
+    )
+    
+    return fig
+
+
 def render_question_form(questions: list, prefix: str, responder: str) -> dict:
     """質問フォームをレンダリング"""
     responses = {}
@@ -520,7 +383,7 @@ def main():
     if 'manager_responses' not in st.session_state:
         st.session_state.manager_responses = None
     if 'single_responses' not in st.session_state:
-        st.session_state.single_responses = {}
+        st.session_state.single_responses = bytearray(N_QUESTIONS)
     if 'single_submitted' not in st.session_state:
         st.session_state.single_submitted = False
     
@@ -555,6 +418,11 @@ def main():
             index=0
         )
         
+        organization_id = st.text_input(
+            "事業所ID（任意）",
+            help="同じ事業所で繰り返し診断する場合に入力すると、前回からのギャップの変化を検知します"
+        ).strip()
+        
         st.divider()
         
         # 診断モード選択
@@ -575,6 +443,9 @@ def main():
                     st.session_state.session_id = generate_session_id()
                     st.session_state.executive_responses = None
                     st.session_state.manager_responses = None
+                    log_event("session_start", session_id=st.session_state.session_id,
+                              business_type=business_type, scale=scale,
+                              organization_id=organization_id)
                     st.rerun()
             else:
                 st.success(f"セッションID:\n{st.session_state.session_id}")
@@ -587,6 +458,8 @@ def main():
                 st.markdown(f"- 管理者: {'✅ 完了' if mgr_done else '⏳ 未回答'}")
                 
                 if st.button("🔄 セッションをリセット", use_container_width=True):
+                    log_event("session_reset", session_id=st.session_state.session_id)
+                    flush_pending_executive()
                     st.session_state.session_id = None
                     st.session_state.executive_responses = None
                     st.session_state.manager_responses = None
@@ -628,16 +501,19 @@ def main():
             render_dual_report(business_type, scale)
         elif not exec_done:
             # 経営者の回答フォーム
-            render_executive_form()
+            render_executive_form(business_type, scale, organization_id)
         else:
             # 管理者の回答フォーム
-            render_manager_form()
+            render_manager_form(business_type, scale, organization_id)
     else:
         # シングル診断モード
-        render_single_mode(business_type, scale)
+        render_single_mode(business_type, scale, organization_id)
+    
+    if is_admin(st.query_params.get("admin")):
+        render_correlation_view()
 
 
-def render_executive_form():
+def render_executive_form(business_type: str, scale: str, organization_id: str):
     """経営者用回答フォーム"""
     st.header("👔 経営者として回答してください")
     st.info("まず経営者（代表・理事長など）の視点で回答してください。回答後、管理者の方に同じ質問に回答していただきます。")
@@ -656,7 +532,12 @@ def render_executive_form():
             hard_responses = render_question_form(HARD_QUESTIONS, "hard", "executive")
         
         if st.button("✅ 経営者の回答を確定", type="primary", use_container_width=True):
-            st.session_state.executive_responses = {**soft_responses, **hard_responses}
+            st.session_state.executive_responses = encode_responses({**soft_responses, **hard_responses})
+            log_event("executive_submit", session_id=st.session_state.session_id,
+                      answers=st.session_state.executive_responses.hex(),
+                      business_type=business_type, scale=scale, organization_id=organization_id)
+            # 組のフラグが決まるまで相関の集計は保留する（管理者の回答確定時に反映）
+            st.session_state.pending_executive = (organization_id, st.session_state.executive_responses)
             st.success("経営者の回答を保存しました。次は管理者の回答をお願いします。")
             st.rerun()
     
@@ -664,7 +545,21 @@ def render_executive_form():
         st.info("経営者の回答が完了すると、管理者の回答に進めます。")
 
 
-def render_manager_form():
+def flush_pending_executive(pair_flags: int = 0):
+    """保留中の経営者の回答を相関の集計に反映
+
+    アーカイブと同じく、組のフラグは経営者の回答にも付ける。管理者が回答しないままリセットした
+    場合は組がないため、経営者の回答自体のフラグだけで判定する。
+    """
+    pending = st.session_state.get("pending_executive")
+    if pending is None:
+        return
+    st.session_state.pending_executive = None
+    organization_id, answers = pending
+    get_correlation_tracker().update(organization_id, "executive", answers, screen_one(answers) | pair_flags)
+
+
+def render_manager_form(business_type: str, scale: str, organization_id: str):
     """管理者用回答フォーム"""
     st.header("👷 管理者として回答してください")
     st.warning("⚠️ 経営者とは**別の方**（施設長・管理者など）が回答してください。")
@@ -684,7 +579,22 @@ def render_manager_form():
             hard_responses = render_question_form(HARD_QUESTIONS, "hard", "manager")
         
         if st.button("✅ 管理者の回答を確定", type="primary", use_container_width=True):
-            st.session_state.manager_responses = {**soft_responses, **hard_responses}
+            st.session_state.manager_responses = encode_responses({**soft_responses, **hard_responses})
+            log_event("manager_submit", session_id=st.session_state.session_id,
+                      answers=st.session_state.manager_responses.hex(),
+                      business_type=business_type, scale=scale, organization_id=organization_id)
+            exec_answers = st.session_state.executive_responses
+            answers = st.session_state.manager_responses
+            pair_flags = screen_pair(exec_answers, answers)
+            flush_pending_executive(pair_flags)
+            get_correlation_tracker().update(organization_id, "manager", answers, screen_one(answers) | pair_flags)
+            st.session_state.drift_alerts = []
+            # スクリーニングで集計から除外される組はドリフトの統計量にも入れない
+            if organization_id and not (screen_one(exec_answers) | screen_one(answers) | pair_flags):
+                alerts = get_drift_detector().update(organization_id, gap_features(exec_answers, answers))
+                st.session_state.drift_alerts = alerts
+                for alert in alerts:
+                    log_event("drift_alert", session_id=st.session_state.session_id, **alert)
             st.success("管理者の回答を保存しました。診断レポートを表示します。")
             st.rerun()
     
@@ -693,25 +603,106 @@ def render_manager_form():
         st.info("⏳ 管理者の回答: 入力中...")
 
 
-def render_dual_report(business_type: str, scale: str):
-    """デュアル診断レポートを表示"""
-    st.header("📊 デュアル診断レポート")
-    st.success("経営者・管理者の両方の回答が完了しました。認識ギャップを分析します。")
-    
+def build_dual_derived(exec_answers: bytes, mgr_answers: bytes) -> dict:
+    """デュアル診断レポートの派生オブジェクト（スコア・ギャップ・グラフ）を生成"""
     # スコア計算
-    exec_scores = calculate_scores(st.session_state.executive_responses)
-    mgr_scores = calculate_scores(st.session_state.manager_responses)
+    exec_scores = calculate_scores(exec_answers)
+    mgr_scores = calculate_scores(mgr_answers)
     
     # ギャップ分析
-    gap_df = calculate_gap_analysis(
-        st.session_state.executive_responses,
-        st.session_state.manager_responses
-    )
+    gap_df = calculate_gap_analysis(exec_answers, mgr_answers)
     
     # 象限判定
     exec_quadrant = determine_quadrant(exec_scores['soft_score'], exec_scores['hard_score'])
     mgr_quadrant = determine_quadrant(mgr_scores['soft_score'], mgr_scores['hard_score'])
     
+    return {
+        "exec_scores": exec_scores,
+        "mgr_scores": mgr_scores,
+        "gap_df": gap_df,
+        "exec_quadrant": exec_quadrant,
+        "mgr_quadrant": mgr_quadrant,
+        "quadrant_fig": create_quadrant_chart(
+            exec_scores['soft_score'], exec_scores['hard_score'],
+            mgr_scores['soft_score'], mgr_scores['hard_score']
+        ),
+        "comparison_fig": create_gap_comparison_chart(gap_df),
+        "radar_fig": create_dual_radar_chart(exec_scores['radar_scores'], mgr_scores['radar_scores']),
+        "screening": [
+            ("経営者", screen_one(exec_answers)),
+            ("管理者", screen_one(mgr_answers)),
+            ("経営者・管理者", screen_pair(exec_answers, mgr_answers)),
+        ],
+    }
+
+
+def build_single_derived(answers: bytes) -> dict:
+    """シングル診断レポートの派生オブジェクト（スコア・グラフ）を生成"""
+    scores = calculate_scores(answers)
+    return {
+        "scores": scores,
+        "quadrant": determine_quadrant(scores['soft_score'], scores['hard_score']),
+        "quadrant_fig": create_quadrant_chart(scores['soft_score'], scores['hard_score']),
+        "radar_fig": create_radar_chart(scores['radar_scores']),
+        "screening": [("回答", screen_one(answers))],
+    }
+
+
+def render_screening_warning(screening: list):
+    """不注意回答の疑いがある場合に注意を表示"""
+    messages = [
+        f"- {who}: {label}"
+        for who, flags in screening
+        for label in describe_flags(flags)
+    ]
+    if messages:
+        st.warning(
+            "⚠️ **回答内容の確認をお願いします**\n\n"
+            + "\n".join(messages)
+            + "\n\n初期値のまま、または機械的に回答された可能性があります。"
+            "この診断結果は統計集計の対象外となります。"
+        )
+
+
+def render_drift_alerts(alerts: list):
+    """前回までの診断からギャップが拡大した項目を表示"""
+    if not alerts:
+        return
+    lines = "\n".join(
+        f"- {alert['label']}：ギャップ {alert['gap']:.1f}点（これまでの平均 {alert['baseline']:.1f}点）"
+        for alert in alerts
+    )
+    st.warning(f"📈 **前回までの診断から認識ギャップが拡大しています**\n\n{lines}")
+
+
+def render_recommendations(recommendations: list):
+    """改善提案を重要度に応じた表示で描画"""
+    for rec in recommendations:
+        render = getattr(st, rec["severity"])
+        if rec["group"] == "gap":
+            render(f"### {rec['title']}\n\n{rec['body']}")
+        else:
+            render(f"**{rec['title']}**：{rec['body']}")
+
+
+def render_dual_report(business_type: str, scale: str):
+    """デュアル診断レポートを表示"""
+    st.header("📊 デュアル診断レポート")
+    st.success("経営者・管理者の両方の回答が完了しました。認識ギャップを分析します。")
+    
+    rules = get_rules()
+    exec_answers = st.session_state.executive_responses
+    mgr_answers = st.session_state.manager_responses
+    if st.session_state.get("report_logged") != st.session_state.session_id:
+        log_event("report_view", session_id=st.session_state.session_id, mode="dual")
+        st.session_state.report_logged = st.session_state.session_id
+    derived = build_dual_derived(exec_answers, mgr_answers)
+    exec_scores = derived["exec_scores"]
+    mgr_scores = derived["mgr_scores"]
+    gap_df = derived["gap_df"]
+    exec_quadrant = derived["exec_quadrant"]
+    mgr_quadrant = derived["mgr_quadrant"]
+    
     # サマリー表示
     col1, col2, col3 = st.columns(3)
     
@@ -725,13 +716,15 @@ def render_dual_report(business_type: str, scale: str):
     
     with col3:
         avg_gap = gap_df['abs_gap'].mean()
-        gap_level = "大" if avg_gap >= 1.5 else ("中" if avg_gap >= 0.8 else "小")
         st.metric("平均ギャップ", f"{avg_gap:.2f}点")
-        st.caption(f"ギャップレベル: {gap_level}")
+        st.caption(f"ギャップレベル: {gap_level(avg_gap, rules)}")
     
     st.divider()
     
     # 警告表示
+    render_screening_warning(derived["screening"])
+    render_drift_alerts(st.session_state.get("drift_alerts", []))
+    
     if exec_quadrant != mgr_quadrant:
         st.markdown(f"""
         <div class="gap-warning">
@@ -761,68 +754,35 @@ def render_dual_report(business_type: str, scale: str):
     tab1, tab2, tab3, tab4 = st.tabs(["4象限マトリクス", "回答比較", "レーダーチャート", "詳細データ"])
     
     with tab1:
-        fig = create_quadrant_chart(
-            exec_scores['soft_score'], exec_scores['hard_score'],
-            mgr_scores['soft_score'], mgr_scores['hard_score']
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(derived["quadrant_fig"], use_container_width=True)
     
     with tab2:
-        fig = create_gap_comparison_chart(gap_df)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(derived["comparison_fig"], use_container_width=True)
     
     with tab3:
-        fig = create_dual_radar_chart(exec_scores['radar_scores'], mgr_scores['radar_scores'])
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(derived["radar_fig"], use_container_width=True)
     
     with tab4:
         display_df = gap_df[['category', 'question', 'executive_score', 'manager_score', 'gap']].copy()
         display_df.columns = ['カテゴリ', '質問', '経営者', '管理者', 'ギャップ']
         st.dataframe(display_df, use_container_width=True, hide_index=True)
+        st.download_button(
+            "📥 CSVをダウンロード",
+            data=display_df.to_csv(index=False).encode("utf-8-sig"),
+            file_name=f"gap_{st.session_state.session_id}.csv",
+            mime="text/csv"
+        )
     
     # 改善提案
     st.divider()
     st.header("💡 改善提案")
     
-    if avg_gap >= 1.5:
-        st.error("""
-        ### 🚨 緊急対応が必要です
-        
-        経営者と管理者の間に大きな認識ギャップがあります。このまま放置すると、
-        以下のリスクが顕在化する可能性があります：
-        
-        - 現場の不満蓄積による一斉退職
-        - 実地指導での想定外の指摘
-        - 内部告発や労働問題
-        
-        **推奨アクション：**
-        1. 経営者と管理者で本診断結果を共有し、認識のすり合わせを行う
-        2. 特にギャップの大きい項目について、現場の実態を確認する
-        3. 定期的な1on1ミーティングを設定し、コミュニケーションを強化する
-        """)
-    elif avg_gap >= 0.8:
-        st.warning("""
-        ### ⚠️ 注意が必要です
-        
-        一部の項目で認識のズレが見られます。早めに対処することで、
-        大きな問題に発展することを防げます。
-        
-        **推奨アクション：**
-        1. ギャップのある項目について、双方の認識を確認する
-        2. 情報共有の仕組みを見直す
-        3. 定期的な振り返りの機会を設ける
-        """)
-    else:
-        st.success("""
-        ### ✅ 良好な状態です
-        
-        経営者と管理者の認識が概ね一致しています。
-        この状態を維持するために、引き続きコミュニケーションを大切にしてください。
-        
-        **推奨アクション：**
-        1. 現在の良好なコミュニケーションを継続する
-        2. 定期的に本診断を実施し、変化を早期に検知する
-        """)
+    features = build_features(
+        answers_matrix([exec_answers]), answers_matrix([mgr_answers]), business_type, scale, rules
+    )
+    render_recommendations(
+        get_engine(rules.version).recommend(features, groups=("quadrant", "gap", "category", "business"))[0]
+    )
     
     # 診断情報
     st.divider()
@@ -835,7 +795,7 @@ def render_dual_report(business_type: str, scale: str):
     """)
 
 
-def render_single_mode(business_type: str, scale: str):
+def render_single_mode(business_type: str, scale: str, organization_id: str):
     """シングル診断モード"""
     st.info("💡 **デュアル診断モード**を選択すると、経営者と管理者の認識ギャップを可視化できます。サイドバーから選択してください。")
     
@@ -852,11 +812,11 @@ def render_single_mode(business_type: str, scale: str):
             for q in SOFT_QUESTIONS:
                 st.markdown(f"**{q['question']}**")
                 st.caption(q['description'])
-                st.session_state.single_responses[q['id']] = st.slider(
+                st.session_state.single_responses[QUESTION_INDEX[q['id']]] = st.slider(
                     label=q['id'],
                     min_value=1,
                     max_value=5,
-                    value=st.session_state.single_responses.get(q['id'], 3),
+                    value=get_answer(st.session_state.single_responses, q['id']),
                     key=f"single_{q['id']}",
                     label_visibility="collapsed"
                 )
@@ -867,11 +827,11 @@ def render_single_mode(business_type: str, scale: str):
             for q in HARD_QUESTIONS:
                 st.markdown(f"**{q['question']}**")
                 st.caption(q['description'])
-                st.session_state.single_responses[q['id']] = st.slider(
+                st.session_state.single_responses[QUESTION_INDEX[q['id']]] = st.slider(
                     label=q['id'],
                     min_value=1,
                     max_value=5,
-                    value=st.session_state.single_responses.get(q['id'], 3),
+                    value=get_answer(st.session_state.single_responses, q['id']),
                     key=f"single_{q['id']}",
                     label_visibility="collapsed"
                 )
@@ -879,14 +839,25 @@ def render_single_mode(business_type: str, scale: str):
         
         if st.button("🔍 診断を実行", type="primary", use_container_width=True):
             st.session_state.single_submitted = True
+            st.session_state.single_session_id = generate_session_id()
+            log_event("single_submit", session_id=st.session_state.single_session_id,
+                      answers=bytes(st.session_state.single_responses).hex(),
+                      business_type=business_type, scale=scale, organization_id=organization_id)
+            answers = bytes(st.session_state.single_responses)
+            get_correlation_tracker().update(organization_id, "single", answers, screen_one(answers))
             st.success("診断が完了しました！「診断レポート」タブで結果をご確認ください。")
     
     with tab2:
         if not st.session_state.single_submitted:
             st.warning("まず「診断フォーム」タブで質問に回答し、「診断を実行」ボタンを押してください。")
         else:
-            scores = calculate_scores(st.session_state.single_responses)
-            quadrant = determine_quadrant(scores['soft_score'], scores['hard_score'])
+            answers = bytes(st.session_state.single_responses)
+            if st.session_state.get("report_logged") != st.session_state.single_session_id:
+                log_event("report_view", session_id=st.session_state.single_session_id, mode="single")
+                st.session_state.report_logged = st.session_state.single_session_id
+            derived = build_single_derived(answers)
+            scores = derived["scores"]
+            quadrant = derived["quadrant"]
             quadrant_info = QUADRANT_DEFINITIONS[quadrant]
             
             st.header("診断結果サマリー")
@@ -899,6 +870,19 @@ def render_single_mode(business_type: str, scale: str):
             with col3:
                 st.metric("総合判定", quadrant)
             
+            render_screening_warning(derived["screening"])
+            
+            rules = get_rules()
+            recommendations = get_engine(rules.version).recommend(
+                build_features(answers_matrix([answers]), None, business_type, scale, rules),
+                groups=("quadrant", "category", "business")
+            )[0]
+            actions = "".join(
+                f"<p><strong>💡 推奨アクション:</strong> {rec['body']}</p>"
+                for rec in recommendations if rec["group"] == "quadrant"
+            )
+            recommendations = [rec for rec in recommendations if rec["group"] != "quadrant"]
+            
             st.divider()
             
             st.markdown(f"""
@@ -910,7 +894,7 @@ def render_single_mode(business_type: str, scale: str):
             ">
                 <h3 style="color: {quadrant_info['color']};">【{quadrant}】</h3>
                 <p>{quadrant_info['description']}</p>
-                <p><strong>💡 推奨アクション:</strong> {quadrant_info['recommendation']}</p>
+                {actions}
             </div>
             """, unsafe_allow_html=True)
             
@@ -918,11 +902,14 @@ def render_single_mode(business_type: str, scale: str):
             
             col1, col2 = st.columns(2)
             with col1:
-                fig = create_quadrant_chart(scores['soft_score'], scores['hard_score'])
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(derived["quadrant_fig"], use_container_width=True)
             with col2:
-                fig = create_radar_chart(scores['radar_scores'])
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(derived["radar_fig"], use_container_width=True)
+            
+            if recommendations:
+                st.divider()
+                st.header("💡 改善提案")
+                render_recommendations(recommendations)
             
             st.divider()
             st.caption(f"""
@@ -933,5 +920,45 @@ def render_single_mode(business_type: str, scale: str):
             """)
 
 
+def render_correlation_view():
+    """質問・カテゴリ間の相関（管理者向け）"""
+    st.divider()
+    st.header("📈 質問・カテゴリ間の相関（管理者向け）")
+    tracker = get_correlation_tracker()
+    counts = tracker.counts()
+    st.caption(f"集計対象: {counts['submissions']}件 / 繰り返し診断の組: {counts['repeat_pairs']}件")
+    
+    tab1, tab2, tab3 = st.tabs(["同時点の相関", "時差相関（前回 → 今回）", "前回の値と変化"])
+    with tab1:
+        st.plotly_chart(create_correlation_heatmap(tracker.correlation(), "質問・カテゴリ間の相関"),
+                        use_container_width=True)
+    with tab2:
+        st.plotly_chart(create_correlation_heatmap(tracker.lagged_correlation(), "前回の値と今回の値の相関",
+                                                   "今回", "前回"),
+                        use_container_width=True)
+    with tab3:
+        st.caption("負の相関は、前回その項目が低い事業所ほど次回に列の項目が上がりやすいことを示します。"
+                   "正の相関は、前回の値が低いほど列の項目が下がりやすいことを示します。")
+        st.plotly_chart(create_correlation_heatmap(tracker.lagged_correlation(change=True),
+                                                   "前回の値と今回までの変化の相関", "今回までの変化", "前回"),
+                        use_container_width=True)
+
+
+def runtime_session_id() -> str:
+    """Streamlit のブラウザセッションIDを取得"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "nosession"
+
+
+def current_session_tag() -> str:
+    """プロファイル等で使うセッション識別子を取得"""
+    return st.session_state.get("session_id") or runtime_session_id()
+
+
 if __name__ == "__main__":
-    main()
+    with profile_rerun(
+        current_session_tag(),
+        enabled=should_profile(st.query_params.get("profile")),
+        memory_probe=lambda: session_memory_report(st.session_state.to_dict(), runtime_session_id())
+    ):
+        main()
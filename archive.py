@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+診断アーカイブ
+Columnar archive of submitted diagnoses, rebuilt from the event log
+
+イベントログ（event_log.py）の回答確定イベントを列ごとの .npy ファイルにまとめます。
+各列はメモリマップで読み込めるため、複数プロセスからコピーなしで参照できます。
+
+列:
+- answers        (N, 14) uint8   質問バンクの列順の回答（0は未回答）
+- role           (N,)    uint8   ROLES のインデックス
+- pair           (N,)    int64   管理者の行に対応する経営者の行（それ以外は -1）
+- ts             (N,)    float64 確定時刻（UNIX 時間）
+- session_id     (N,)    str
+- business_type  (N,)    str
+- scale          (N,)    str
+- organization_id (N,)   str     事業所ID（未入力は空文字）
+- flags          (N,)    uint8   screening.py のフラグ（0以外は集計から除外）
+
+使い方:
+    python archive.py build
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from event_log import replay
+from scoring import N_QUESTIONS
+from screening import screen_answers, screen_pairs
+
+ARCHIVE_DIR_ENV = "WRD_ARCHIVE_DIR"
+DEFAULT_ARCHIVE_DIR = os.path.join("data", "archive")
+MANIFEST_NAME = "manifest.json"
+
+ROLES = ["single", "executive", "manager"]
+SUBMIT_EVENTS = {
+    "single_submit": 0,
+    "executive_submit": 1,
+    "manager_submit": 2,
+}
+COLUMNS = ("answers", "role", "pair", "ts", "session_id", "business_type", "scale", "organization_id", "flags")
+
+
+def archive_dir(directory: str = None) -> str:
+    return directory or os.environ.get(ARCHIVE_DIR_ENV, DEFAULT_ARCHIVE_DIR)
+
+
+def build_archive(event_dir: str = None) -> dict:
+    """イベントログを先頭から読み直し、アーカイブの各列を作成"""
+    answers = bytearray()
+    role, pair, ts = [], [], []
+    session_ids, business_types, scales, organization_ids = [], [], [], []
+    last_executive = {}  # session_id -> 経営者の行
+
+    for event in replay(event_dir, SUBMIT_EVENTS):
+        row = len(role)
+        session_id = event.get("session_id") or ""
+        code = SUBMIT_EVENTS[event["type"]]
+        answers += bytes.fromhex(event["answers"])
+        role.append(code)
+        ts.append(event["ts"])
+        session_ids.append(session_id)
+        business_types.append(event.get("business_type", ""))
+        scales.append(event.get("scale", ""))
+        organization_ids.append(event.get("organization_id", ""))
+        if code == SUBMIT_EVENTS["executive_submit"]:
+            last_executive[session_id] = row
+            pair.append(-1)
+        elif code == SUBMIT_EVENTS["manager_submit"]:
+            pair.append(last_executive.get(session_id, -1))
+        else:
+            pair.append(-1)
+
+    answers = np.frombuffer(bytes(answers), dtype=np.uint8).reshape(-1, N_QUESTIONS)
+    pair = np.array(pair, dtype=np.int64)
+    return {
+        "answers": answers,
+        "role": np.array(role, dtype=np.uint8),
+        "pair": pair,
+        "ts": np.array(ts, dtype=np.float64),
+        "session_id": np.array(session_ids, dtype=str),
+        "business_type": np.array(business_types, dtype=str),
+        "scale": np.array(scales, dtype=str),
+        "organization_id": np.array(organization_ids, dtype=str),
+        "flags": screen_archive(answers, pair),
+    }
+
+
+def screen_archive(answers: np.ndarray, pair: np.ndarray) -> np.ndarray:
+    """取り込み時のスクリーニング（組のフラグは経営者・管理者の両方の行に付ける）"""
+    flags = screen_answers(answers)
+    manager_rows = np.flatnonzero(pair >= 0)
+    if len(manager_rows):
+        executive_rows = pair[manager_rows]
+        pair_flags = screen_pairs(answers[executive_rows], answers[manager_rows])
+        flags[manager_rows] |= pair_flags
+        np.bitwise_or.at(flags, executive_rows, pair_flags)
+    return flags
+
+
+def clean_mask(columns: dict) -> np.ndarray:
+    """集計対象とする行（スクリーニングでフラグが付いていない行）"""
+    return np.asarray(columns["flags"]) == 0
+
+
+def archive_version(columns: dict) -> str:
+    """アーカイブ内容のハッシュ（内容が同じなら同じ値）"""
+    digest = hashlib.sha256()
+    for name in COLUMNS:
+        digest.update(name.encode("utf-8"))
+        digest.update(np.ascontiguousarray(columns[name]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def save_archive(columns: dict, directory: str = None) -> dict:
+    """各列を .npy として保存し、最後にマニフェストを書き換える"""
+    directory = archive_dir(directory)
+    os.makedirs(directory, exist_ok=True)
+    for name, values in columns.items():
+        path = os.path.join(directory, f"{name}.npy")
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, values)
+        os.replace(path + ".tmp", path)
+
+    manifest = {
+        "version": archive_version(columns),
+        "rows": int(len(columns["role"])),
+        "flagged_rows": int(np.count_nonzero(columns["flags"])),
+        "columns": sorted(columns),
+        "built_at": time.time(),
+    }
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+
+def load_manifest(directory: str = None) -> dict:
+    with open(os.path.join(archive_dir(directory), MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_column(name: str, directory: str = None, mmap: bool = True) -> np.ndarray:
+    """アーカイブの1列を読み込む（既定ではメモリマップ）"""
+    return np.load(os.path.join(archive_dir(directory), f"{name}.npy"), mmap_mode="r" if mmap else None)
+
+
+def load_archive(directory: str = None, mmap: bool = True) -> dict:
+    """アーカイブの全列を読み込む"""
+    return {name: load_column(name, directory, mmap) for name in load_manifest(directory)["columns"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="イベントログから診断アーカイブを再構築")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="アーカイブを再構築")
+    build_parser.add_argument("--events", help="イベントログのディレクトリ")
+    build_parser.add_argument("--archive", help="アーカイブの出力先")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    manifest = save_archive(build_archive(args.events), args.archive)
+    print(f"{manifest['rows']} rows ({manifest['flagged_rows']} flagged), version {manifest['version']} "
+          f"({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
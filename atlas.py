@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+スコア空間アトラス
+Exhaustive score-space atlas for calibrating thresholds
+
+Soft・Hard 各7問（1〜5点）の回答の組み合わせは軸ごとに 5^7 = 78,125 通りしかないため、
+calculate_scores / determine_quadrant の入力空間をすべて列挙できます。
+各回答ベクトルを質問ごとの回答分布（アーカイブの実績または事前分布）で重み付けし、
+スコアのヒストグラム・象限の構成比・境界値に対する感度を求めます。
+
+Soft と Hard は独立とみなし、象限の構成比は各軸の分布の積で求めます。
+結果は入力（ルール・回答分布）のハッシュをキーにキャッシュするため、
+境界値の検討では再計算なしで即座に参照できます。
+
+使い方:
+    python atlas.py --prior archive --thresholds 40:80
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from scoring import N_QUESTIONS, N_SOFT, QUADRANTS
+from scoring_rules import ScoringRules, get_rules
+
+DEFAULT_CACHE_DIR = os.path.join("data", "atlas")
+N_LEVELS = 5
+AXIS_QUESTIONS = N_SOFT          # Soft・Hard とも7問
+CHUNK_ROWS = 1 << 14             # 列挙を分割する単位
+THRESHOLDS = np.arange(0, 101)   # 感度分析の境界値（100点換算）。ルールの境界値とその ±SENSITIVITY_DELTA も加える
+SENSITIVITY_DELTA = 1.0
+CACHE_FORMAT = 2                 # キャッシュの内容を変えたら上げる
+
+_POWERS = N_LEVELS ** np.arange(AXIS_QUESTIONS)
+_N_SUMS = AXIS_QUESTIONS * (N_LEVELS - 1) + 1   # 合計点 7〜35 の29通り
+
+
+def uniform_prior() -> np.ndarray:
+    """全問で1〜5点が等確率の回答分布 (14, 5)"""
+    return np.full((N_QUESTIONS, N_LEVELS), 1 / N_LEVELS)
+
+
+def archive_prior(directory: str = None, roles=None, smoothing: float = 1.0) -> np.ndarray:
+    """アーカイブ（スクリーニング済みの行）の質問ごとの回答分布 (14, 5)"""
+    from archive import ROLES, clean_mask, load_archive
+
+    columns = load_archive(directory)
+    mask = clean_mask(columns)
+    if roles:
+        mask &= np.isin(np.asarray(columns["role"]), [ROLES.index(r) for r in roles])
+    answers = np.asarray(columns["answers"])[mask]
+    counts = np.full((N_QUESTIONS, N_LEVELS), smoothing)
+    for level in range(1, N_LEVELS + 1):
+        counts[:, level - 1] += (answers == level).sum(axis=0)
+    return counts / counts.sum(axis=1, keepdims=True)
+
+
+def enumerate_axis(probs: np.ndarray) -> np.ndarray:
+    """1軸（7問）の全回答ベクトルを列挙し、合計点ごとの重み（確率）を返す"""
+    hist = np.zeros(_N_SUMS)
+    question = np.arange(AXIS_QUESTIONS)
+    total = N_LEVELS ** AXIS_QUESTIONS
+    for start in range(0, total, CHUNK_ROWS):
+        index = np.arange(start, min(start + CHUNK_ROWS, total))
+        digits = (index[:, None] // _POWERS) % N_LEVELS          # (m, 7) 各問の回答 - 1
+        weights = probs[question, digits].prod(axis=1)
+        hist += np.bincount(digits.sum(axis=1), weights=weights, minlength=_N_SUMS)
+    return hist
+
+
+def _cache_key(probs: np.ndarray, rules: ScoringRules) -> str:
+    digest = hashlib.sha256()
+    digest.update(str(CACHE_FORMAT).encode("utf-8"))
+    digest.update(json.dumps(rules.to_dict(), sort_keys=True).encode("utf-8"))
+    digest.update(np.ascontiguousarray(probs, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _thresholds(rules: ScoringRules) -> np.ndarray:
+    """計算する境界値（整数の境界値に、ルールの境界値とその ±SENSITIVITY_DELTA を加えたもの）"""
+    own = rules.quadrant_threshold + np.array([-SENSITIVITY_DELTA, 0.0, SENSITIVITY_DELTA])
+    return np.unique(np.concatenate([THRESHOLDS.astype(np.float64), own]))
+
+
+def compute_atlas(probs: np.ndarray, rules: ScoringRules = None) -> dict:
+    """回答分布とルールからアトラスを計算"""
+    rules = rules or get_rules()
+    thresholds = _thresholds(rules)
+    sums = np.arange(_N_SUMS) + AXIS_QUESTIONS
+    scores = sums / AXIS_QUESTIONS / rules.score_max * 100
+    soft_hist = enumerate_axis(probs[:N_SOFT])
+    hard_hist = enumerate_axis(probs[N_SOFT:])
+
+    # 境界値ごとの「境界以上」の確率
+    above = scores[None, :] >= thresholds[:, None]
+    soft_above = (above * soft_hist).sum(axis=1)
+    hard_above = (above * hard_hist).sum(axis=1)
+    # QUADRANTS の順（ホワイト優良経営・砂上の楼閣・万年貧乏・崩壊寸前）
+    shares = np.stack([
+        soft_above * hard_above,
+        (1 - soft_above) * hard_above,
+        soft_above * (1 - hard_above),
+        (1 - soft_above) * (1 - hard_above),
+    ], axis=1)
+
+    return {
+        "scores": scores,
+        "soft_hist": soft_hist,
+        "hard_hist": hard_hist,
+        "thresholds": thresholds,
+        "quadrant_shares": shares,
+        "probs": probs,
+    }
+
+
+def get_atlas(probs: np.ndarray, rules: ScoringRules = None, cache_dir: str = DEFAULT_CACHE_DIR) -> dict:
+    """キャッシュがあれば読み込み、なければ計算して保存"""
+    rules = rules or get_rules()
+    path = os.path.join(cache_dir, f"atlas-{_cache_key(probs, rules)}.npz")
+    if os.path.exists(path):
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    atlas = compute_atlas(probs, rules)
+    os.makedirs(cache_dir, exist_ok=True)
+    # 別プロセスが同じキーを同時に計算しても衝突しないよう、一時ファイルは呼び出しごとに作る
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **atlas)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return atlas
+
+
+def quadrant_share(atlas: dict, threshold: float) -> dict:
+    """境界値を指定して象限の構成比を返す（アトラスで計算していない境界値は ValueError）"""
+    matches = np.flatnonzero(np.isclose(atlas["thresholds"], threshold))
+    if not len(matches):
+        raise ValueError(f"threshold {threshold:g} is not in the atlas (integers 0-100 and the rules' own threshold)")
+    row = int(matches[0])
+    return dict(zip(QUADRANTS, atlas["quadrant_shares"][row].tolist()))
+
+
+def sensitivity(atlas: dict, threshold: float, delta: float = SENSITIVITY_DELTA) -> dict:
+    """境界値1点あたりの象限構成比の変化（ポイント）。±delta の中心差分で求める"""
+    low = quadrant_share(atlas, threshold - delta)
+    high = quadrant_share(atlas, threshold + delta)
+    return {name: (high[name] - low[name]) * 100 / (2 * delta) for name in QUADRANTS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スコア空間アトラス（境界値の検討用）")
+    parser.add_argument("--prior", choices=["uniform", "archive"], default="uniform",
+                        help="回答分布（uniform: 等確率 / archive: アーカイブの実績）")
+    parser.add_argument("--roles", help="archive 使用時に対象とする回答者（single,executive,manager）")
+    parser.add_argument("--archive", help="アーカイブのディレクトリ")
+    parser.add_argument("--rules", help="スコアリングルールのバージョン")
+    parser.add_argument("--thresholds", default="50:70", help="表示する境界値の範囲（開始:終了）")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    rules = get_rules(args.rules)
+    if args.prior == "archive":
+        roles = args.roles.split(",") if args.roles else None
+        probs = archive_prior(args.archive, roles)
+    else:
+        probs = uniform_prior()
+    atlas = get_atlas(probs, rules, args.cache_dir)
+
+    print(f"ルール {rules.version}（現行の境界値 {rules.quadrant_threshold:g}点）/ 回答分布: {args.prior}")
+    print("\n■ スコア分布")
+    for score, soft, hard in zip(atlas["scores"], atlas["soft_hist"], atlas["hard_hist"]):
+        print(f"  {score:5.1f}点  Soft {soft:6.1%}  Hard {hard:6.1%}")
+
+    print("\n■ 現行の境界値での象限構成比（境界値1点あたりの変化）")
+    shares = quadrant_share(atlas, rules.quadrant_threshold)
+    deltas = sensitivity(atlas, rules.quadrant_threshold)
+    for name in QUADRANTS:
+        print(f"  {name:<10} {shares[name]:6.1%}  ({deltas[name]:+.1f}pt)")
+
+    start, stop = (float(x) for x in args.thresholds.split(":"))
+    print("\n■ 境界値ごとの象限構成比")
+    print("  境界値  " + "  ".join(f"{name:>8}" for name in QUADRANTS))
+    for threshold, row in zip(atlas["thresholds"], atlas["quadrant_shares"]):
+        if start <= threshold <= stop:
+            print(f"  {threshold:5g}   " + "  ".join(f"{share:8.1%}" for share in row))
+
+
+if __name__ == "__main__":
+    main()
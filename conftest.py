@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""pytest の設定：リポジトリ直下のモジュール（scoring, archive など）をテストから import できるようにする"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
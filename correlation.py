@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+質問・カテゴリ間の相関分析
+Incremental cross-category correlation analysis
+
+14問の回答と8カテゴリのスコア（計22項目）について、共分散・相関行列を
+Welford 法で1回答ずつ更新します。事業所IDのある繰り返し診断では、同じ事業所・同じ回答者の
+前回と今回の組で時差相関（前回の値と今回の値・今回までの変化との相関）も更新するため、
+「コミュニケーションが低いと次回の人員基準が下がるか」といった先行指標を確認できます。
+
+相関行列はいつでも統計量から直接求められ、アーカイブ全体を集計し直す必要はありません。
+スクリーニングでフラグが付いた回答は集計に含めません。アーカイブ（clean_mask）と同じく、
+経営者の回答は組のフラグが決まる管理者の回答確定時（またはリセット時）に反映します。
+そのため、管理者が回答せずリセットもされなかったセッションの経営者の回答は、rebuild では
+集計されますが、アプリ上の逐次更新には含まれません。
+
+使い方:
+    python correlation.py rebuild           アーカイブから状態を作り直す（初回導入時のみ）
+    python correlation.py show --lagged     相関の強い組み合わせを表示
+
+状態ファイルの場所は環境変数 WRD_CORRELATION_STATE で変更できます（既定: data/correlation/state.npz）。
+"""
+
+import argparse
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from scoring import CATEGORIES, DEFAULT_SCORE, QUESTION_IDS, UNANSWERED, score_matrix
+from snapshot import Snapshot
+
+CORRELATION_STATE_ENV = "WRD_CORRELATION_STATE"
+DEFAULT_STATE_PATH = os.path.join("data", "correlation", "state.npz")
+
+DIMENSIONS = QUESTION_IDS + CATEGORIES
+N_DIMS = len(DIMENSIONS)
+
+_KEY_SEPARATOR = "\t"
+
+
+def state_path(path: str = None) -> str:
+    return path or os.environ.get(CORRELATION_STATE_ENV, DEFAULT_STATE_PATH)
+
+
+def submission_vectors(answers: np.ndarray) -> np.ndarray:
+    """回答行列 (N, 14) から相関分析用のベクトル (N, 22) を作る"""
+    answers = np.asarray(answers, dtype=np.uint8)
+    filled = np.where(answers == UNANSWERED, DEFAULT_SCORE, answers).astype(np.float64)
+    return np.hstack([filled, score_matrix(answers)["radar_scores"]])
+
+
+class StreamingMoments:
+    """平均と偏差積和（Welford 法）。バッチ同士の統合（Chan らの方法）にも対応"""
+
+    def __init__(self, dim: int):
+        self.n = 0
+        self.mean = np.zeros(dim)
+        self.m2 = np.zeros((dim, dim))
+
+    def update(self, x: np.ndarray):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += np.outer(delta, x - self.mean)
+
+    def update_batch(self, xs: np.ndarray):
+        if len(xs) == 0:
+            return
+        n_batch = len(xs)
+        mean_batch = xs.mean(axis=0)
+        centered = xs - mean_batch
+        n = self.n + n_batch
+        delta = mean_batch - self.mean
+        self.m2 += centered.T @ centered + np.outer(delta, delta) * self.n * n_batch / n
+        self.mean += delta * n_batch / n
+        self.n = n
+
+    def covariance(self) -> np.ndarray:
+        if self.n < 2:
+            return np.full_like(self.m2, np.nan)
+        return self.m2 / (self.n - 1)
+
+
+def _correlate(cov: np.ndarray, var_rows: np.ndarray, var_cols: np.ndarray) -> np.ndarray:
+    """共分散を標準偏差の積で割る（分散0の項目は NaN）"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.sqrt(np.outer(var_rows, var_cols))
+    corr[~np.isfinite(corr)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+class CorrelationTracker:
+    """全回答の相関と、繰り返し診断の時差相関を保持する（path が None なら保存しない）"""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.moments = StreamingMoments(N_DIMS)
+        self.lagged = StreamingMoments(2 * N_DIMS)   # [前回の22項目, 今回の22項目]
+        self._previous = {}   # (organization_id, role) -> 前回のベクトル
+        if path and os.path.exists(path):
+            self.load(path)
+        self._snapshot = Snapshot(path, self._lock, self._collect, "correlation")
+
+    def update(self, organization_id: str, role: str, answers: bytes, flags: int = 0):
+        """1回答分で統計量を更新（flags はスクリーニング結果。0以外は集計しない）"""
+        if flags:
+            return
+        x = submission_vectors(np.frombuffer(answers, dtype=np.uint8).reshape(1, -1))[0]
+        with self._lock:
+            self.moments.update(x)
+            if organization_id:
+                key = (organization_id, role)
+                previous = self._previous.get(key)
+                if previous is not None:
+                    self.lagged.update(np.concatenate([previous, x]))
+                self._previous[key] = x
+            self._snapshot.dirty = True
+        self._snapshot.maybe_save()
+
+    def correlation(self) -> pd.DataFrame:
+        """22項目の相関行列"""
+        with self._lock:
+            cov = self.moments.covariance()
+        variances = np.diag(cov)
+        return pd.DataFrame(_correlate(cov, variances, variances), index=DIMENSIONS, columns=DIMENSIONS)
+
+    def lagged_correlation(self, change: bool = False) -> pd.DataFrame:
+        """時差相関（行: 前回の項目、列: 今回の項目）
+
+        change=True のときは、前回の値と「前回から今回への変化」との相関を返す。
+        """
+        with self._lock:
+            cov = self.lagged.covariance()
+        previous = cov[:N_DIMS, :N_DIMS]
+        current = cov[N_DIMS:, N_DIMS:]
+        cross = cov[:N_DIMS, N_DIMS:]
+        if change:
+            cross = cross - previous
+            col_var = np.diag(current) + np.diag(previous) - 2 * np.diag(cov[:N_DIMS, N_DIMS:])
+        else:
+            col_var = np.diag(current)
+        return pd.DataFrame(_correlate(cross, np.diag(previous), col_var), index=DIMENSIONS, columns=DIMENSIONS)
+
+    def counts(self) -> dict:
+        with self._lock:
+            return {
+                "submissions": self.moments.n,
+                "repeat_pairs": self.lagged.n,
+                "tracked": len(self._previous),
+            }
+
+    def maybe_save(self, force: bool = False):
+        self._snapshot.maybe_save(force)
+
+    def save(self, path: str):
+        self._snapshot.save(path)
+
+    def _collect(self) -> dict:
+        return {
+            "dimensions": np.array(DIMENSIONS, dtype=str),
+            "keys": np.array([_KEY_SEPARATOR.join(key) for key in self._previous], dtype=str),
+            "previous": np.array(list(self._previous.values())).reshape(-1, N_DIMS),
+            "n": np.array([self.moments.n, self.lagged.n]),
+            "mean": self.moments.mean.copy(),
+            "m2": self.moments.m2.copy(),
+            "lagged_mean": self.lagged.mean.copy(),
+            "lagged_m2": self.lagged.m2.copy(),
+        }
+
+    def load(self, path: str):
+        with np.load(path) as data:
+            if list(data["dimensions"]) != DIMENSIONS:
+                raise ValueError(f"{path}: dimensions do not match the question bank")
+            with self._lock:
+                self.moments.n, self.lagged.n = (int(n) for n in data["n"])
+                self.moments.mean = data["mean"]
+                self.moments.m2 = data["m2"]
+                self.lagged.mean = data["lagged_mean"]
+                self.lagged.m2 = data["lagged_m2"]
+                self._previous = {
+                    tuple(key.split(_KEY_SEPARATOR, 1)): vector
+                    for key, vector in zip(data["keys"], data["previous"])
+                }
+
+
+def rebuild(archive_path: str = None, path: str = None) -> CorrelationTracker:
+    """アーカイブのスクリーニング済みの行から状態を作り直す（導入時・状態ファイル消失時用）
+
+    放置されたセッションの経営者の回答も含むため、逐次更新した状態とはその分だけ異なる。
+    """
+    from archive import ROLES, clean_mask, load_archive
+
+    columns = load_archive(archive_path)
+    rows = np.flatnonzero(clean_mask(columns))
+    vectors = submission_vectors(np.asarray(columns["answers"])[rows])
+    tracker = CorrelationTracker(path=None)
+    tracker.moments.update_batch(vectors)
+
+    # 事業所・回答者ごとに時刻順に並べ、隣り合う行を前回・今回の組にする
+    organizations = np.asarray(columns["organization_id"])[rows]
+    roles = np.asarray(columns["role"])[rows]
+    order = np.lexsort((np.asarray(columns["ts"])[rows], roles, organizations))
+    order = order[organizations[order] != ""]
+    same = (organizations[order][1:] == organizations[order][:-1]) & (roles[order][1:] == roles[order][:-1])
+    tracker.lagged.update_batch(np.hstack([vectors[order][:-1][same], vectors[order][1:][same]]))
+    for i in order:
+        tracker._previous[(organizations[i], ROLES[roles[i]])] = vectors[i]
+
+    tracker.path = state_path(path)
+    tracker.save(tracker.path)
+    return tracker
+
+
+def top_pairs(matrix: pd.DataFrame, limit: int = 10, symmetric: bool = True) -> list:
+    """相関の絶対値が大きい組み合わせ"""
+    values = matrix.to_numpy()
+    mask = np.isfinite(values)
+    if symmetric:
+        mask &= np.triu(np.ones_like(mask), k=1).astype(bool)
+    rows, cols = np.nonzero(mask)
+    order = np.argsort(-np.abs(values[rows, cols]))[:limit]
+    return [(matrix.index[rows[k]], matrix.columns[cols[k]], float(values[rows[k], cols[k]])) for k in order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="質問・カテゴリ間の相関分析")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = sub.add_parser("rebuild", help="アーカイブから状態を作り直す")
+    rebuild_parser.add_argument("--archive", help="アーカイブのディレクトリ")
+    show_parser = sub.add_parser("show", help="相関の強い組み合わせを表示")
+    show_parser.add_argument("--lagged", action="store_true", help="時差相関（前回 → 今回）を表示")
+    show_parser.add_argument("--change", action="store_true", help="前回の値と今回までの変化との相関を表示")
+    show_parser.add_argument("--limit", type=int, default=15)
+    for sub_parser in (rebuild_parser, show_parser):
+        sub_parser.add_argument(
+            "--state", help=f"状態ファイル（既定: ${CORRELATION_STATE_ENV} または {DEFAULT_STATE_PATH}）"
+        )
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        tracker = rebuild(args.archive, args.state)
+        counts = tracker.counts()
+        print(f"{counts['submissions']} submissions, {counts['repeat_pairs']} repeat pairs -> {tracker.path}")
+        return
+
+    tracker = CorrelationTracker(state_path(args.state))
+    if args.lagged or args.change:
+        matrix = tracker.lagged_correlation(change=args.change)
+        pairs = top_pairs(matrix, args.limit, symmetric=False)
+        arrow = "前回 → 今回までの変化" if args.change else "前回 → 今回"
+    else:
+        matrix = tracker.correlation()
+        pairs = top_pairs(matrix, args.limit)
+        arrow = "同時点"
+    print(f"■ {arrow}（{tracker.counts()}）")
+    for row, col, value in pairs:
+        print(f"  {row:<16} {col:<16} {value:+.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+認識ギャップのドリフト検知
+Streaming gap-drift alerts across repeat dual diagnoses
+
+事業所（organization_id）× 質問・カテゴリごとに、経営者と管理者のギャップ（絶対値）の
+指数加重平均・指数加重分散と、増加方向の CUSUM（累積和）による変化点スコアを保持します。
+管理者の回答確定ごとに O(1) で更新し、変化点スコアが閾値を超えたら警告を返します。
+過去の履歴は読み直さず、状態は小さな配列のスナップショットとして保存します。
+スクリーニングでフラグが付いた組（経営者・管理者いずれかの回答、または組のフラグ）は更新に使いません。
+
+使い方:
+    python drift.py rebuild     イベントログから状態を作り直す（初回導入時のみ）
+    python drift.py show ORG    事業所の現在の状態を表示
+
+状態ファイルの場所は環境変数 WRD_DRIFT_STATE で変更できます（既定: data/drift/state.npz）。
+"""
+
+import argparse
+import os
+import threading
+
+import numpy as np
+
+from scoring import (
+    CATEGORIES, QUESTION_IDS, SOFT_QUESTIONS, HARD_QUESTIONS, answers_matrix, gap_matrix, score_matrix,
+)
+from snapshot import Snapshot
+
+DRIFT_STATE_ENV = "WRD_DRIFT_STATE"
+DEFAULT_STATE_PATH = os.path.join("data", "drift", "state.npz")
+
+EWM_ALPHA = 0.3         # 指数加重の重み（繰り返し診断は間隔が長いため大きめ）
+PRIOR_VARIANCE = 1.0    # 初回観測時の分散の仮定
+VARIANCE_FLOOR = 0.25   # 標準化に使う分散の下限（安定した事業所で1点の変動だけで警告しないよう）
+CUSUM_SLACK = 0.5       # 標準化した増分からこの値を差し引いて累積する
+CUSUM_THRESHOLD = 3.0   # これを超えたら警告
+INITIAL_CAPACITY = 1024
+
+FEATURES = QUESTION_IDS + [f"cat:{cat}" for cat in CATEGORIES]
+FEATURE_LABELS = [q["question"] for q in SOFT_QUESTIONS + HARD_QUESTIONS] + [f"カテゴリ「{cat}」" for cat in CATEGORIES]
+N_FEATURES = len(FEATURES)
+
+_STATE_ARRAYS = ("count", "mean", "var", "cusum", "last")
+
+
+def state_path(path: str = None) -> str:
+    return path or os.environ.get(DRIFT_STATE_ENV, DEFAULT_STATE_PATH)
+
+
+def gap_features(exec_answers: bytes, mgr_answers: bytes) -> np.ndarray:
+    """質問別・カテゴリ別のギャップの絶対値（22要素）"""
+    exec_matrix = answers_matrix([exec_answers])
+    mgr_matrix = answers_matrix([mgr_answers])
+    question_gaps = gap_matrix(exec_matrix, mgr_matrix)["gap"][0]
+    category_gaps = (score_matrix(exec_matrix)["radar_scores"] - score_matrix(mgr_matrix)["radar_scores"])[0]
+    return np.abs(np.concatenate([question_gaps.astype(np.float64), category_gaps]))
+
+
+class GapDriftDetector:
+    """事業所ごとのギャップの移動統計量と変化点スコアを保持する（path が None なら保存しない）"""
+
+    def __init__(self, path: str = None, alpha: float = EWM_ALPHA,
+                 slack: float = CUSUM_SLACK, threshold: float = CUSUM_THRESHOLD):
+        self.path = path
+        self.alpha = alpha
+        self.slack = slack
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._index = {}   # organization_id -> 行
+        self._allocate(INITIAL_CAPACITY)
+        if path and os.path.exists(path):
+            self.load(path)
+        self._snapshot = Snapshot(path, self._lock, self._collect, "drift")
+
+    def _allocate(self, capacity: int):
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros((capacity, N_FEATURES))
+        self.var = np.zeros((capacity, N_FEATURES))
+        self.cusum = np.zeros((capacity, N_FEATURES))
+        self.last = np.zeros((capacity, N_FEATURES))
+
+    def _row(self, organization_id: str) -> int:
+        row = self._index.get(organization_id)
+        if row is None:
+            row = len(self._index)
+            if row >= len(self.count):
+                for name in _STATE_ARRAYS:
+                    array = getattr(self, name)
+                    grown = np.zeros((len(array) * 2,) + array.shape[1:], dtype=array.dtype)
+                    grown[:len(array)] = array
+                    setattr(self, name, grown)
+            self._index[organization_id] = row
+        return row
+
+    def update(self, organization_id: str, gaps: np.ndarray) -> list:
+        """1回分のギャップで統計量を更新し、閾値を超えた項目の警告を返す"""
+        with self._lock:
+            row = self._row(organization_id)
+            alerts = []
+            if self.count[row] == 0:
+                self.mean[row] = gaps
+                self.var[row] = PRIOR_VARIANCE
+            else:
+                baseline = self.mean[row].copy()
+                std = np.sqrt(np.maximum(self.var[row], VARIANCE_FLOOR))
+                self.cusum[row] = np.maximum(0.0, self.cusum[row] + (gaps - baseline) / std - self.slack)
+                diff = gaps - baseline
+                self.mean[row] = baseline + self.alpha * diff
+                self.var[row] = (1 - self.alpha) * (self.var[row] + self.alpha * diff ** 2)
+
+                for j in np.flatnonzero(self.cusum[row] > self.threshold):
+                    alerts.append({
+                        "organization_id": organization_id,
+                        "feature": FEATURES[j],
+                        "label": FEATURE_LABELS[j],
+                        "gap": float(gaps[j]),
+                        "baseline": float(baseline[j]),
+                        "score": float(self.cusum[row, j]),
+                    })
+                    self.cusum[row, j] = 0.0   # 警告後は累積をリセット
+            self.last[row] = gaps
+            self.count[row] += 1
+            self._snapshot.dirty = True
+        self._snapshot.maybe_save()
+        return alerts
+
+    def state(self, organization_id: str) -> dict:
+        """事業所の現在の統計量"""
+        with self._lock:
+            row = self._index.get(organization_id)
+            if row is None:
+                return None
+            return {
+                "count": int(self.count[row]),
+                "features": {
+                    feature: {
+                        "mean": float(self.mean[row, j]),
+                        "std": float(np.sqrt(self.var[row, j])),
+                        "cusum": float(self.cusum[row, j]),
+                        "last": float(self.last[row, j]),
+                    }
+                    for j, feature in enumerate(FEATURES)
+                },
+            }
+
+    def maybe_save(self, force: bool = False):
+        self._snapshot.maybe_save(force)
+
+    def save(self, path: str):
+        self._snapshot.save(path)
+
+    def _collect(self) -> dict:
+        n = len(self._index)
+        return {
+            "organizations": np.array(sorted(self._index, key=self._index.get), dtype=str),
+            "features": np.array(FEATURES, dtype=str),
+            **{name: getattr(self, name)[:n].copy() for name in _STATE_ARRAYS},
+        }
+
+    def load(self, path: str):
+        with np.load(path) as data:
+            if list(data["features"]) != FEATURES:
+                raise ValueError(f"{path}: feature layout does not match the question bank")
+            organizations = list(data["organizations"])
+            with self._lock:
+                self._allocate(max(INITIAL_CAPACITY, 2 * len(organizations)))
+                self._index = {org: row for row, org in enumerate(organizations)}
+                for name in _STATE_ARRAYS:
+                    getattr(self, name)[:len(organizations)] = data[name]
+
+
+def rebuild(event_dir: str = None, path: str = None) -> GapDriftDetector:
+    """イベントログを一度だけ読み直して状態を作り直す（導入時・状態ファイル消失時用）"""
+    from event_log import replay
+    from screening import screen_one, screen_pair
+
+    detector = GapDriftDetector(path=None)
+    executive = {}
+    for event in replay(event_dir, ["executive_submit", "manager_submit"]):
+        if event["type"] == "executive_submit":
+            executive[event.get("session_id")] = bytes.fromhex(event["answers"])
+            continue
+        organization_id = event.get("organization_id")
+        exec_answers = executive.get(event.get("session_id"))
+        if not organization_id or exec_answers is None:
+            continue
+        mgr_answers = bytes.fromhex(event["answers"])
+        if screen_one(exec_answers) | screen_one(mgr_answers) | screen_pair(exec_answers, mgr_answers):
+            continue
+        detector.update(organization_id, gap_features(exec_answers, mgr_answers))
+    detector.path = state_path(path)
+    detector.save(detector.path)
+    return detector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="認識ギャップのドリフト検知")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = sub.add_parser("rebuild", help="イベントログから状態を作り直す")
+    rebuild_parser.add_argument("--events", help="イベントログのディレクトリ")
+    show_parser = sub.add_parser("show", help="事業所の状態を表示")
+    show_parser.add_argument("organization_id")
+    for sub_parser in (rebuild_parser, show_parser):
+        sub_parser.add_argument("--state", help=f"状態ファイル（既定: ${DRIFT_STATE_ENV} または {DEFAULT_STATE_PATH}）")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        detector = rebuild(args.events, args.state)
+        print(f"{len(detector._index)} organizations -> {detector.path}")
+        return
+
+    state = GapDriftDetector(state_path(args.state)).state(args.organization_id)
+    if state is None:
+        parser.error(f"unknown organization: {args.organization_id}")
+    print(f"診断回数: {state['count']}")
+    for feature, stats in state["features"].items():
+        print(f"  {feature:<22} 平均 {stats['mean']:.2f}  標準偏差 {stats['std']:.2f}  "
+              f"変化点スコア {stats['cusum']:.2f}  直近 {stats['last']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+診断イベントログ（追記専用）
+Append-only event log for submissions and session lifecycle events
+
+回答の確定やセッションの開始・リセットなどを追記専用のセグメントファイルに記録します。
+書き込みは専用スレッドでまとめて行い、fsync は一括（グループコミット）で実行するため、
+ボタン操作ごとの待ち時間は発生しません。
+
+レコード形式: [ペイロード長 uint32][CRC32 uint32][JSON (UTF-8)]
+セグメント:   events-00000001.log, events-00000002.log, ...（一定サイズでローテーション）
+
+アーカイブ・集計・インデックスは replay() で先頭から順に読み直して再構築できます。
+"""
+
+import atexit
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+EVENT_LOG_DIR_ENV = "WRD_EVENT_LOG_DIR"
+DEFAULT_EVENT_LOG_DIR = os.path.join("data", "events")
+
+EVENT_TYPES = (
+    "session_start",
+    "session_reset",
+    "executive_submit",
+    "manager_submit",
+    "single_submit",
+    "report_view",
+    "drift_alert",
+)
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_COMMIT_INTERVAL = 0.05  # グループコミットの最大待ち時間（秒）
+DEFAULT_MAX_BATCH = 1024
+
+_HEADER = struct.Struct("<II")
+_SEGMENT_PREFIX = "events-"
+_SEGMENT_SUFFIX = ".log"
+_STOP = object()
+
+
+def segment_paths(directory: str) -> list:
+    """セグメントファイルを古い順に返す"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def _segment_number(path: str) -> int:
+    return int(os.path.basename(path)[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+
+
+def encode_record(event: dict) -> bytes:
+    payload = json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_segment(path: str):
+    """1セグメント分のイベントを順に返す
+
+    書き込み途中で途切れた末尾は無視する。末尾以外で CRC が一致しないレコードがあれば、
+    以降は読めないため標準エラーに報告して打ち切る。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    view = memoryview(data)
+    offset = 0
+    end = len(data)
+    while offset + _HEADER.size <= end:
+        length, crc = _HEADER.unpack_from(view, offset)
+        start = offset + _HEADER.size
+        if start + length > end:
+            break
+        payload = view[start:start + length]
+        if zlib.crc32(payload) != crc:
+            if start + length < end:
+                print(f"[event_log] corrupt record in {path} at offset {offset}; "
+                      f"skipped the remaining {end - offset} bytes", file=sys.stderr)
+            break
+        yield json.loads(bytes(payload))
+        offset = start + length
+
+
+def replay(directory: str = None, event_types=None):
+    """全セグメントのイベントを記録順に返す"""
+    directory = directory or os.environ.get(EVENT_LOG_DIR_ENV, DEFAULT_EVENT_LOG_DIR)
+    wanted = set(event_types) if event_types else None
+    for path in segment_paths(directory):
+        for event in iter_segment(path):
+            if wanted is None or event.get("type") in wanted:
+                yield event
+
+
+class EventLog:
+    """グループコミット方式の追記専用イベントログ"""
+
+    def __init__(self, directory: str = None, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 commit_interval: float = DEFAULT_COMMIT_INTERVAL, max_batch: int = DEFAULT_MAX_BATCH):
+        self.directory = directory or os.environ.get(EVENT_LOG_DIR_ENV, DEFAULT_EVENT_LOG_DIR)
+        self.segment_bytes = segment_bytes
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        os.makedirs(self.directory, exist_ok=True)
+
+        # 途中で途切れている可能性のある既存セグメントには追記せず、新しいセグメントから始める
+        existing = segment_paths(self.directory)
+        self._segment_no = _segment_number(existing[-1]) + 1 if existing else 1
+        self._file = None
+
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._appended = 0
+        self._committed = 0
+        self.failed = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer, name="wrd-event-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, f"{_SEGMENT_PREFIX}{self._segment_no:08d}{_SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        self._segment_no += 1
+
+    def append(self, event_type: str, **fields) -> int:
+        """イベントを書き込み待ちに追加し、flush() に渡せる通し番号を返す（ブロックしない）"""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"unknown event type: {event_type}")
+        record = encode_record({"ts": time.time(), "type": event_type, **fields})
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("event log is closed")
+            self._appended += 1
+            self._queue.put(record)
+            return self._appended
+
+    def flush(self, seq: int = None, timeout: float = None) -> bool:
+        """seq（省略時はここまでに追加した全件）が fsync されるまで待つ"""
+        with self._cond:
+            target = self._appended if seq is None else seq
+            return self._cond.wait_for(lambda: self._committed >= target, timeout=timeout)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+
+    def _writer(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.commit_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: list):
+        try:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(b"".join(batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if self._file.tell() >= self.segment_bytes:
+                self._open_segment()
+        except OSError as exc:
+            print(f"[event_log] write failed: {exc}", file=sys.stderr)
+            self.failed += len(batch)
+        with self._cond:
+            self._committed += len(batch)
+            self._cond.notify_all()
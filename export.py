@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+診断データの一括エクスポート
+Streaming bulk export of diagnoses and gap tables
+
+アーカイブのスコア・カテゴリ別スコア・ギャップ表を、事業種別と診断日（日本時間）で
+パーティション分割した CSV として ZIP（Deflate 圧縮）に書き出します。
+行は一定件数ずつ ZIP に直接書き込むため、表全体をメモリ上に作ることはありません。
+完成したファイルはアーカイブとスコアリングルールの版ごとにキャッシュし、2回目以降のダウンロードは
+ファイルをそのまま返すだけになります。古い版のファイルは新しい版の作成時に削除し、直近 KEEP_EXPORTS 個だけ残します。
+
+ZIP の構成:
+    diagnoses/business_type=<事業種別>/date=<YYYY-MM-DD>/part-00000.csv
+    gaps/business_type=<事業種別>/date=<YYYY-MM-DD>/part-00000.csv
+
+使い方:
+    python export.py
+"""
+
+import argparse
+import io
+import os
+import re
+import tempfile
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from archive import ROLES, load_archive, load_manifest
+from scoring import (
+    CATEGORIES, QUADRANTS, QUESTION_IDS, SOFT_QUESTIONS, HARD_QUESTIONS, gap_matrix, score_matrix,
+)
+from scoring_rules import get_rules
+
+DEFAULT_EXPORT_DIR = os.path.join("data", "exports")
+CHUNK_ROWS = 50_000          # 1回に CSV 化する行数
+STREAM_CHUNK_BYTES = 1 << 20  # ダウンロード時に1回で送るバイト数
+JST_OFFSET_SECONDS = 9 * 3600
+KEEP_EXPORTS = 2             # 残しておくエクスポートファイルの数（新しい順）
+
+_QUESTIONS = SOFT_QUESTIONS + HARD_QUESTIONS
+
+_build_locks = {}   # エクスポートファイルのパス -> 作成中のロック
+_build_locks_guard = threading.Lock()
+
+
+def _partition_value(value: str) -> str:
+    """パーティション名に使えない文字を置き換える"""
+    return re.sub(r'[\\/:*?"<>|=]', "_", value) or "不明"
+
+
+def _dates(ts: np.ndarray) -> np.ndarray:
+    """UNIX 時間を日本時間の日付文字列に変換"""
+    days = ((np.asarray(ts) + JST_OFFSET_SECONDS) // 86400).astype("datetime64[D]")
+    return days.astype(str)
+
+
+def _diagnosis_frame(columns: dict, rows: np.ndarray, rules) -> pd.DataFrame:
+    answers = np.asarray(columns["answers"][rows])
+    scores = score_matrix(answers, rules)
+    frame = pd.DataFrame({
+        "session_id": columns["session_id"][rows],
+        "role": np.asarray(ROLES)[columns["role"][rows]],
+        "business_type": columns["business_type"][rows],
+        "scale": columns["scale"][rows],
+        "submitted_at": pd.to_datetime(columns["ts"][rows], unit="s", utc=True).tz_convert("Asia/Tokyo"),
+        "soft_score": scores["soft_score"].round(1),
+        "hard_score": scores["hard_score"].round(1),
+        "quadrant": np.asarray(QUADRANTS)[scores["quadrant"]],
+        "flags": columns["flags"][rows],
+    })
+    for j, cat in enumerate(CATEGORIES):
+        frame[f"radar_{cat}"] = scores["radar_scores"][:, j].round(2)
+    for j, qid in enumerate(QUESTION_IDS):
+        frame[qid] = answers[:, j]
+    return frame
+
+
+def _gap_frame(columns: dict, manager_rows: np.ndarray) -> pd.DataFrame:
+    """calculate_gap_analysis と同じ列構成の縦持ちのギャップ表"""
+    executive_rows = np.asarray(columns["pair"][manager_rows])
+    exec_answers = np.asarray(columns["answers"][executive_rows])
+    mgr_answers = np.asarray(columns["answers"][manager_rows])
+    gaps = gap_matrix(exec_answers, mgr_answers)["gap"]
+    n = len(manager_rows)
+    return pd.DataFrame({
+        "session_id": np.repeat(columns["session_id"][manager_rows], len(_QUESTIONS)),
+        "id": np.tile(QUESTION_IDS, n),
+        "category": np.tile([q["category"] for q in _QUESTIONS], n),
+        "type": np.tile(["Soft" if q["id"].startswith("soft") else "Hard" for q in _QUESTIONS], n),
+        "executive_score": exec_answers.ravel(),
+        "manager_score": mgr_answers.ravel(),
+        "gap": gaps.ravel(),
+    })
+
+
+def _write_csv(zf: zipfile.ZipFile, name: str, frames) -> None:
+    """DataFrame のチャンクを ZIP の1エントリへ順に書き込む"""
+    with zf.open(name, "w", force_zip64=True) as raw:
+        with io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as out:
+            header = True
+            for frame in frames:
+                frame.to_csv(out, index=False, header=header)
+                header = False
+
+
+def _chunks(rows: np.ndarray):
+    for start in range(0, len(rows), CHUNK_ROWS):
+        yield rows[start:start + CHUNK_ROWS]
+
+
+def build_export(archive_path: str = None, export_dir: str = DEFAULT_EXPORT_DIR) -> str:
+    """アーカイブの版に対応するエクスポートファイルを返す（なければ作成）"""
+    manifest = load_manifest(archive_path)
+    rules = get_rules()
+    path = os.path.join(export_dir, f"export-{manifest['version']}-{rules.version}.zip")
+    if os.path.exists(path):
+        return path
+
+    # 同じ版の作成は1回にまとめ、待っていた呼び出しは完成したファイルを返す
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(path, threading.Lock())
+    with lock:
+        if not os.path.exists(path):
+            _write_export(archive_path, path, rules)
+            _prune_exports(export_dir, keep=path)
+    return path
+
+
+def _prune_exports(export_dir: str, keep: str, count: int = KEEP_EXPORTS) -> None:
+    """新しい順に count 個を残して古いエクスポートファイルを削除（keep は必ず残す）
+
+    ダウンロード中のファイルを削除しても、開いているストリームは最後まで読める。
+    """
+    entries = []
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        if name.startswith("export-") and name.endswith(".zip") and path != keep:
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass
+    for _, path in sorted(entries, reverse=True)[max(count - 1, 0):]:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        with _build_locks_guard:
+            _build_locks.pop(path, None)
+
+
+def _write_export(archive_path: str, path: str, rules) -> None:
+    """エクスポートを一時ファイルに書き、完成後に path へ置き換える"""
+    columns = load_archive(archive_path)
+    export_dir = os.path.dirname(path) or "."
+    os.makedirs(export_dir, exist_ok=True)
+    # 別プロセスが同時に作成しても衝突しないよう、一時ファイルは呼び出しごとに作る
+    fd, tmp_path = tempfile.mkstemp(dir=export_dir, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            _write_zip(f, columns, rules)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_zip(f, columns: dict, rules) -> None:
+    business_types = np.asarray(columns["business_type"])
+    dates = _dates(columns["ts"])
+    pair = np.asarray(columns["pair"])
+
+    # 事業種別・日付の順に並べ、パーティションの境界を求める
+    order = np.lexsort((dates, business_types))
+    sorted_types = business_types[order]
+    sorted_dates = dates[order]
+    changes = np.flatnonzero(
+        (sorted_types[1:] != sorted_types[:-1]) | (sorted_dates[1:] != sorted_dates[:-1])
+    ) + 1
+    bounds = np.concatenate([[0], changes, [len(order)]])
+
+    with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if start == stop:
+                continue
+            rows = order[start:stop]
+            partition = (f"business_type={_partition_value(sorted_types[start])}/"
+                         f"date={sorted_dates[start]}")
+            _write_csv(zf, f"diagnoses/{partition}/part-00000.csv",
+                       (_diagnosis_frame(columns, chunk, rules) for chunk in _chunks(rows)))
+            manager_rows = rows[pair[rows] >= 0]
+            if len(manager_rows):
+                _write_csv(zf, f"gaps/{partition}/part-00000.csv",
+                           (_gap_frame(columns, chunk) for chunk in _chunks(manager_rows)))
+
+
+def iter_file(path: str, chunk_bytes: int = STREAM_CHUNK_BYTES):
+    """ファイルを一定サイズずつ読み出す（ダウンロードのストリーミング用）"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="診断データを事業種別・日付別の CSV（ZIP）に書き出す")
+    parser.add_argument("--archive", help="アーカイブのディレクトリ")
+    parser.add_argument("--output", default=DEFAULT_EXPORT_DIR, help="エクスポートの保存先")
+    args = parser.parse_args()
+    print(build_export(args.archive, args.output))
+
+
+if __name__ == "__main__":
+    main()
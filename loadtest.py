@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+同時利用負荷テスト
+Concurrent-user load-testing harness
+
+Streamlit の AppTest（インプロセス実行ハーネス）をプロセスプールで並列に動かし、
+実際の利用シナリオを模擬します。ネットワークは使用しません。
+各ワーカーは起動時に全シナリオを1回ずつ実行して import 等を済ませ（ウォームアップ）、
+その実行は集計に含めません。プールは全段階で使い回すため、各段階の計測はウォーム状態で行います。
+イベントログやドリフト・相関の統計量は一時ディレクトリに書き込み、終了時に削除します。
+
+シナリオ:
+- single: シングル診断（回答 → 診断を実行 → レポート）
+- dual:   デュアル診断（セッション開始 → 経営者回答 → 管理者回答 → レポート）
+
+使い方:
+    python loadtest.py --concurrency 1,2,4,8 --iterations 5
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from scoring import QUESTION_IDS
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+JOURNEYS = ("single", "dual")
+APP_TIMEOUT = 60
+
+# 負荷テストの回答が本番のイベントログ・統計量に混ざらないよう、書き込み先を一時ディレクトリに向ける
+STATE_ENV = {
+    "WRD_EVENT_LOG_DIR": "events",
+    "WRD_DRIFT_STATE": os.path.join("drift", "state.npz"),
+    "WRD_CORRELATION_STATE": os.path.join("correlation", "state.npz"),
+}
+
+
+def _check(at):
+    """スクリプト実行中の例外を検出"""
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def _click(at, label: str):
+    """ラベルでボタンを探してクリックし、再実行する"""
+    for button in at.button:
+        if button.label == label:
+            return _check(button.click().run())
+    raise LookupError(f"button not found: {label}")
+
+
+def _answer(at, key_of, rng: random.Random):
+    """全14問にランダムな回答を設定"""
+    for qid in QUESTION_IDS:
+        at.slider(key=key_of(qid)).set_value(rng.randint(1, 5))
+
+
+def _journey_single(at, rng, step):
+    step("load", lambda: _check(at.run()))
+    _answer(at, lambda qid: f"single_{qid}", rng)
+    step("submit", lambda: _click(at, "🔍 診断を実行"))
+
+
+def _journey_dual(at, rng, step):
+    step("load", lambda: _check(at.run()))
+    step("select_mode", lambda: _check(at.sidebar.radio[0].set_value("デュアル診断（推奨）").run()))
+    step("start_session", lambda: _click(at, "🚀 新規診断セッションを開始"))
+    _answer(at, lambda qid: f"{qid.split('_')[0]}_{qid}_executive", rng)
+    step("executive_submit", lambda: _click(at, "✅ 経営者の回答を確定"))
+    _answer(at, lambda qid: f"{qid.split('_')[0]}_{qid}_manager", rng)
+    step("manager_submit", lambda: _click(at, "✅ 管理者の回答を確定"))
+    step("report", lambda: _check(at.run()))
+
+
+JOURNEY_RUNNERS = {
+    "single": _journey_single,
+    "dual": _journey_dual,
+}
+
+
+def _warm_up(journeys) -> None:
+    """ワーカーの初期化：各シナリオを1回ずつ実行し、import やキャッシュの初回コストを済ませる"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(0)
+    for journey in journeys:
+        JOURNEY_RUNNERS[journey](AppTest.from_file(APP_PATH, default_timeout=APP_TIMEOUT), rng,
+                                 lambda name, fn: fn())
+
+
+def _ready(hold_seconds: float) -> int:
+    """全ワーカーを起動させるためのダミーの処理（ウォームアップ済みのワーカーの PID を返す）"""
+    time.sleep(hold_seconds)
+    return os.getpid()
+
+
+def start_pool(workers: int, journeys) -> ProcessPoolExecutor:
+    """ウォームアップ済みのワーカーを workers 個そろえたプールを作る"""
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up, initargs=(tuple(journeys),))
+    pids = set()
+    while len(pids) < workers:
+        # 同時に workers 個の処理を投入すると、ワーカーが足りない分だけ起動される
+        pids.update(pool.map(_ready, [0.2] * workers))
+    return pool
+
+
+def simulate_user(journey: str, iterations: int, seed: int, trace_memory: bool) -> dict:
+    """1ユーザー分のシナリオを繰り返し実行し、ステップ毎の所要時間を返す（ワーカープロセスで実行）
+
+    ワーカーはウォームアップ済みのため、メモリのピークは import を含まない1シナリオ分の値になる。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    timings = defaultdict(list)
+    peaks = []
+
+    for _ in range(iterations):
+        at = AppTest.from_file(APP_PATH, default_timeout=APP_TIMEOUT)
+
+        def step(name, fn):
+            started = time.perf_counter()
+            fn()
+            timings[name].append(time.perf_counter() - started)
+
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        JOURNEY_RUNNERS[journey](at, rng, step)
+        timings["journey_total"].append(time.perf_counter() - started)
+        if trace_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    return {"journey": journey, "timings": dict(timings), "peak_bytes": peaks}
+
+
+def isolate_state(directory: str) -> None:
+    """アプリの書き込み先を directory 配下に変更（ワーカープロセスは環境変数を引き継ぐ）"""
+    for name, relative in STATE_ENV.items():
+        os.environ[name] = os.path.join(directory, relative)
+
+
+def run_level(pool: ProcessPoolExecutor, concurrency: int, iterations: int, journeys,
+              trace_memory: bool, seed: int) -> dict:
+    """指定した同時ユーザー数で負荷をかけ、集計結果を返す（pool は concurrency 個以上のワーカーを持つこと）"""
+    jobs = [(journeys[i % len(journeys)], iterations, seed + i, trace_memory) for i in range(concurrency)]
+
+    started = time.perf_counter()
+    results = list(pool.map(simulate_user, *zip(*jobs)))
+    wall = time.perf_counter() - started
+
+    summary = {"concurrency": concurrency, "wall_seconds": wall, "journeys": {}}
+    for journey in journeys:
+        merged = defaultdict(list)
+        peaks = []
+        for result in results:
+            if result["journey"] != journey:
+                continue
+            for name, values in result["timings"].items():
+                merged[name].extend(values)
+            peaks.extend(result["peak_bytes"])
+        if not merged:
+            continue
+        completed = len(merged["journey_total"])
+        summary["journeys"][journey] = {
+            "completed": completed,
+            "throughput_per_s": completed / wall if wall > 0 else 0.0,
+            "steps": {
+                name: {
+                    "p50_ms": float(np.percentile(values, 50) * 1000),
+                    "p95_ms": float(np.percentile(values, 95) * 1000),
+                    "p99_ms": float(np.percentile(values, 99) * 1000),
+                }
+                for name, values in merged.items()
+            },
+            "peak_mb": float(max(peaks) / 1024 / 1024) if peaks else None,
+        }
+    return summary
+
+
+def find_capacity(levels: list, degrade_factor: float):
+    """journey_total の p95 が基準の degrade_factor 倍を超える直前の同時数を返す
+
+    基準はシナリオごとに、そのシナリオを含む最初（最小同時数）の段階の値とする。
+    同時数1ではシナリオが1つしか実行されないため、他のシナリオの基準は次の段階から取る。
+    """
+    if not levels:
+        return None
+    baseline = {}
+    for level in levels:
+        for journey, stats in level["journeys"].items():
+            baseline.setdefault(journey, stats["steps"]["journey_total"]["p95_ms"])
+    capacity = levels[0]["concurrency"]
+    for level in levels:
+        degraded = any(
+            stats["steps"]["journey_total"]["p95_ms"] > baseline[journey] * degrade_factor
+            for journey, stats in level["journeys"].items()
+        )
+        if degraded:
+            break
+        capacity = level["concurrency"]
+    return capacity
+
+
+def print_report(levels: list, capacity) -> None:
+    for level in levels:
+        print(f"\n=== 同時ユーザー数 {level['concurrency']} (経過 {level['wall_seconds']:.1f}s) ===")
+        for journey, stats in level["journeys"].items():
+            peak = f"{stats['peak_mb']:.1f} MB" if stats["peak_mb"] is not None else "-"
+            print(f"[{journey}] 完了 {stats['completed']} 件 / {stats['throughput_per_s']:.2f} journeys/s / "
+                  f"セッション最大メモリ {peak}")
+            for name, pct in stats["steps"].items():
+                print(f"  {name:<18} p50 {pct['p50_ms']:8.1f} ms  p95 {pct['p95_ms']:8.1f} ms  "
+                      f"p99 {pct['p99_ms']:8.1f} ms")
+    if capacity is not None:
+        print(f"\n遅延が悪化しない最大同時ユーザー数: {capacity}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="福祉経営リスク診断アプリの同時利用負荷テスト")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="同時ユーザー数（カンマ区切りで段階的に増加）")
+    parser.add_argument("--iterations", type=int, default=5, help="1ユーザーあたりのシナリオ実行回数")
+    parser.add_argument("--journeys", default="single,dual", help="実行するシナリオ（single,dual）")
+    parser.add_argument("--degrade-factor", type=float, default=2.0,
+                        help="p95 が基準の何倍を超えたら悪化とみなすか")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="tracemalloc によるメモリ計測を無効化（計測によるオーバーヘッドを除く）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    journeys = [j for j in args.journeys.split(",") if j]
+    unknown = set(journeys) - set(JOURNEYS)
+    if unknown:
+        parser.error(f"unknown journeys: {', '.join(sorted(unknown))}")
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    with tempfile.TemporaryDirectory(prefix="wrd-loadtest-") as directory:
+        isolate_state(directory)
+        with start_pool(max(concurrency_levels), journeys) as pool:
+            levels = [
+                run_level(pool, c, args.iterations, journeys, not args.no_memory, args.seed)
+                for c in concurrency_levels
+            ]
+    capacity = find_capacity(levels, args.degrade_factor)
+    print_report(levels, capacity)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"levels": levels, "capacity": capacity}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    # AppTest はワーカー内で __main__ を app.py に差し替えるため、ワーカーに渡す関数は
+    # __main__ ではなくモジュール名（loadtest）で参照されるようにする
+    import loadtest
+    loadtest.main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+オンデマンド・プロファイラ
+On-demand profiler for individual Streamlit reruns
+
+管理者用クエリパラメータ（?profile=<WRD_ADMIN_TOKEN>）または環境変数
+WRD_PROFILE=1 が指定された場合のみ、main() の1回の実行を計測します。
+同時に計測するのは1つの実行だけで、計測中に始まった他の実行は計測せずに処理します。
+無効時は環境変数の参照と文字列比較のみで、計測コストはほぼゼロです。
+
+出力（WRD_PROFILE_DIR、既定: profiles/）:
+- <session>_<timestamp>.prof       cProfile の決定論的プロファイル（pstats / snakeviz で参照）
+- <session>_<timestamp>.collapsed  サンプリングによる折り畳みスタック（flamegraph.pl / speedscope 用）
+- <session>_<timestamp>.mem.json   セッション毎のメモリ使用量（memory_probe 指定時）
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_ENV = "WRD_PROFILE"
+ADMIN_TOKEN_ENV = "WRD_ADMIN_TOKEN"
+PROFILE_DIR_ENV = "WRD_PROFILE_DIR"
+PROFILE_MAX_MB_ENV = "WRD_PROFILE_MAX_MB"
+
+DEFAULT_PROFILE_DIR = "profiles"
+DEFAULT_MAX_MB = 50
+SAMPLE_INTERVAL = 0.005  # サンプリング間隔（秒）
+
+# cProfile はプロセス全体で1つしか有効にできない（3.12 以降は sys.monitoring を共有する）ため、
+# 同時に計測する実行は1つに限る
+_profile_lock = threading.Lock()
+
+
+def is_admin(token) -> bool:
+    """クエリパラメータのトークンが管理者トークンと一致するか判定"""
+    expected = os.environ.get(ADMIN_TOKEN_ENV)
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(str(token), expected)
+
+
+def should_profile(query_token=None) -> bool:
+    """この実行をプロファイルするか判定"""
+    if os.environ.get(PROFILE_ENV) == "1":
+        return True
+    return query_token is not None and is_admin(query_token)
+
+
+def _profile_dir() -> str:
+    return os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+
+
+def _max_bytes() -> int:
+    try:
+        return int(float(os.environ.get(PROFILE_MAX_MB_ENV, DEFAULT_MAX_MB)) * 1024 * 1024)
+    except ValueError:
+        return DEFAULT_MAX_MB * 1024 * 1024
+
+
+def _safe_tag(session_id) -> str:
+    """ファイル名に使えるようセッションIDを整形"""
+    tag = re.sub(r"[^A-Za-z0-9_-]", "_", str(session_id or "nosession"))
+    return tag[:64]
+
+
+def enforce_disk_cap(directory: str, max_bytes: int) -> None:
+    """古いファイルから削除し、ディレクトリの合計サイズを上限以下に保つ"""
+    if not os.path.isdir(directory):
+        return
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+class StackSampler:
+    """対象スレッドのスタックを定期的に採取し、折り畳みスタック形式で集計"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wrd-stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_rerun(session_id=None, enabled: bool = False, memory_probe=None):
+    """main() の1回の実行をプロファイルし、結果をセッションID付きで保存"""
+    if not enabled:
+        yield None
+        return
+    if not _profile_lock.acquire(blocking=False):
+        print("[profile] skipped: another rerun is being profiled", file=sys.stderr)
+        yield None
+        return
+    try:
+        with _profile_session(session_id, memory_probe) as stem:
+            yield stem
+    finally:
+        _profile_lock.release()
+
+
+@contextmanager
+def _profile_session(session_id, memory_probe):
+    directory = _profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    max_bytes = _max_bytes()
+    enforce_disk_cap(directory, max_bytes)
+
+    stem = os.path.join(
+        directory,
+        f"{_safe_tag(session_id)}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    )
+    sampler = StackSampler(threading.get_ident())
+    profiler = cProfile.Profile()
+
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield stem
+    finally:
+        profiler.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+        profiler.dump_stats(stem + ".prof")
+        sampler.write_collapsed(stem + ".collapsed")
+        if memory_probe is not None:
+            with open(stem + ".mem.json", "w", encoding="utf-8") as f:
+                json.dump(memory_probe(), f, ensure_ascii=False, indent=2)
+        enforce_disk_cap(directory, max_bytes)
+        print(f"[profile] {stem}.prof ({elapsed * 1000:.1f} ms)", file=sys.stderr)
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+改善提案エンジン
+Table-driven recommendation engine with batch evaluation
+
+改善提案はルール表（RECOMMENDATION_RULES）で定義します。各ルールの条件は
+カテゴリ別スコア・ギャップ・象限・事業種別・事業所規模に対する比較で、
+配列演算の述語にコンパイルされるため、1件のレポートでも数千事業所の一括処理でも
+同じ1回の評価で提案を求められます。
+
+特徴量（build_features が作成）:
+- quadrant / exec_quadrant / mgr_quadrant   象限名（シングル診断では quadrant のみ）
+- soft_score / hard_score                   100点換算スコア（デュアル診断では管理者の値）
+- cat:<カテゴリ>                            カテゴリ別スコア（デュアル診断では管理者の値）
+- gap:<カテゴリ>                            カテゴリ別ギャップ（経営者 - 管理者、シングル診断では NaN）
+- avg_gap                                   平均ギャップ（シングル診断では NaN）
+- business_type / scale                     基本情報
+
+条件の値に "$gap_level_high" のように書くと、スコアリングルール（scoring_rules.py）の値を参照します。
+"""
+
+import argparse
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from scoring import CATEGORIES, QUADRANT_DEFINITIONS, QUADRANTS, gap_matrix, score_matrix
+from scoring_rules import ScoringRules, get_rules
+
+# グループ：quadrant（総合判定）/ gap（認識ギャップ）/ category（カテゴリ別）/ business（事業種別・規模）
+RECOMMENDATION_RULES = [
+    # 総合判定
+    *[
+        {
+            "id": f"quadrant_{i}",
+            "group": "quadrant",
+            "severity": "info",
+            "priority": 10,
+            "when": [("quadrant", "==", name)],
+            "title": name,
+            "body": QUADRANT_DEFINITIONS[name]["recommendation"],
+        }
+        for i, name in enumerate(QUADRANTS)
+    ],
+    # 認識ギャップ
+    {
+        "id": "gap_high",
+        "group": "gap",
+        "severity": "error",
+        "priority": 20,
+        "when": [("avg_gap", ">=", "$gap_level_high")],
+        "title": "🚨 緊急対応が必要です",
+        "body": (
+            "経営者と管理者の間に大きな認識ギャップがあります。このまま放置すると、\n"
+            "以下のリスクが顕在化する可能性があります：\n\n"
+            "- 現場の不満蓄積による一斉退職\n"
+            "- 実地指導での想定外の指摘\n"
+            "- 内部告発や労働問題\n\n"
+            "**推奨アクション：**\n"
+            "1. 経営者と管理者で本診断結果を共有し、認識のすり合わせを行う\n"
+            "2. 特にギャップの大きい項目について、現場の実態を確認する\n"
+            "3. 定期的な1on1ミーティングを設定し、コミュニケーションを強化する"
+        ),
+    },
+    {
+        "id": "gap_medium",
+        "group": "gap",
+        "severity": "warning",
+        "priority": 20,
+        "when": [("avg_gap", ">=", "$gap_level_medium"), ("avg_gap", "<", "$gap_level_high")],
+        "title": "⚠️ 注意が必要です",
+        "body": (
+            "一部の項目で認識のズレが見られます。早めに対処することで、\n"
+            "大きな問題に発展することを防げます。\n\n"
+            "**推奨アクション：**\n"
+            "1. ギャップのある項目について、双方の認識を確認する\n"
+            "2. 情報共有の仕組みを見直す\n"
+            "3. 定期的な振り返りの機会を設ける"
+        ),
+    },
+    {
+        "id": "gap_low",
+        "group": "gap",
+        "severity": "success",
+        "priority": 20,
+        "when": [("avg_gap", "<", "$gap_level_medium")],
+        "title": "✅ 良好な状態です",
+        "body": (
+            "経営者と管理者の認識が概ね一致しています。\n"
+            "この状態を維持するために、引き続きコミュニケーションを大切にしてください。\n\n"
+            "**推奨アクション：**\n"
+            "1. 現在の良好なコミュニケーションを継続する\n"
+            "2. 定期的に本診断を実施し、変化を早期に検知する"
+        ),
+    },
+    {
+        "id": "gap_communication_overrated",
+        "group": "gap",
+        "severity": "warning",
+        "priority": 25,
+        "when": [("gap:コミュニケーション", ">=", 1.5)],
+        "title": "経営者がコミュニケーションを過大評価しています",
+        "body": "経営者が思うほど、現場は「話せている」と感じていません。"
+                "匿名アンケートや、経営者が同席しない面談の場を設けてください。",
+    },
+    # カテゴリ別の弱点
+    {
+        "id": "weak_retention",
+        "group": "category",
+        "severity": "warning",
+        "priority": 30,
+        "when": [("cat:人材定着", "<", 2.5)],
+        "title": "人材定着",
+        "body": "退職理由のヒアリングと記録を徹底し、離職の傾向を把握してください。",
+    },
+    {
+        "id": "weak_training",
+        "group": "category",
+        "severity": "warning",
+        "priority": 30,
+        "when": [("cat:育成", "<", 2.5)],
+        "title": "育成",
+        "body": "新人向けの OJT 計画とマニュアルを整備し、管理者向けのマネジメント研修を検討してください。",
+    },
+    {
+        "id": "weak_philosophy",
+        "group": "category",
+        "severity": "warning",
+        "priority": 30,
+        "when": [("cat:理念", "<", 2.5)],
+        "title": "理念",
+        "body": "理念を日常業務の判断基準に落とし込み、朝礼や会議で繰り返し共有してください。",
+    },
+    {
+        "id": "weak_communication",
+        "group": "category",
+        "severity": "warning",
+        "priority": 30,
+        "when": [("cat:コミュニケーション", "<", 2.5)],
+        "title": "コミュニケーション",
+        "body": "定期的な 1on1 面談と、経営者と現場職員が直接話す機会を設けてください。",
+    },
+    {
+        "id": "weak_staffing",
+        "group": "category",
+        "severity": "error",
+        "priority": 30,
+        "when": [("cat:人員基準", "<", 2.5)],
+        "title": "人員基準",
+        "body": "常勤換算と配置基準の充足状況を直ちに再計算してください。基準割れは報酬返還につながります。",
+    },
+    {
+        "id": "weak_records",
+        "group": "category",
+        "severity": "error",
+        "priority": 30,
+        "when": [("cat:記録", "<", 2.5)],
+        "title": "記録",
+        "body": "個別支援計画の見直し時期とサービス提供記録の作成状況を点検し、記録の当日作成を徹底してください。",
+    },
+    {
+        "id": "weak_safety",
+        "group": "category",
+        "severity": "error",
+        "priority": 30,
+        "when": [("cat:安全管理", "<", 2.5)],
+        "title": "安全管理",
+        "body": "虐待防止委員会の開催・研修と BCP の策定・訓練は義務です。未実施の場合は減算の対象になります。",
+    },
+    {
+        "id": "weak_addons",
+        "group": "category",
+        "severity": "warning",
+        "priority": 30,
+        "when": [("cat:加算管理", "<", 2.5)],
+        "title": "加算管理",
+        "body": "算定可能な加算を一覧化し、要件と算定状況を照合して算定漏れを洗い出してください。",
+    },
+    # 事業種別・規模
+    {
+        "id": "residential_safety",
+        "group": "business",
+        "severity": "warning",
+        "priority": 40,
+        "when": [
+            ("business_type", "in", ["障がい者グループホーム", "特別養護老人ホーム"]),
+            ("cat:安全管理", "<", 3.5),
+        ],
+        "title": "入所・居住系サービスの安全管理",
+        "body": "夜間帯を含む24時間の支援体制では、虐待防止と災害時対応の重要性が特に高くなります。"
+                "夜勤者を含めた訓練を計画してください。",
+    },
+    {
+        "id": "visiting_records",
+        "group": "business",
+        "severity": "warning",
+        "priority": 40,
+        "when": [
+            ("business_type", "in", ["訪問看護ステーション", "訪問介護"]),
+            ("cat:記録", "<", 3.5),
+        ],
+        "title": "訪問系サービスの記録",
+        "body": "訪問記録は実地指導で最も確認される項目です。訪問直後に記録できる仕組み（モバイル入力など）を検討してください。",
+    },
+    {
+        "id": "multisite_management",
+        "group": "business",
+        "severity": "warning",
+        "priority": 40,
+        "when": [
+            ("scale", "in", ["2-5拠点・30-100名", "6拠点以上・100名以上"]),
+            ("cat:育成", "<", 3.5),
+        ],
+        "title": "複数拠点の管理者育成",
+        "body": "拠点数が増えるほど、経営方針を現場に翻訳する管理者の力が業績を左右します。"
+                "拠点管理者の育成計画を優先してください。",
+    },
+]
+
+_OPERATORS = {
+    "==": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    ">=": lambda column, value: column >= value,
+    ">": lambda column, value: column > value,
+    "<=": lambda column, value: column <= value,
+    "<": lambda column, value: column < value,
+    "in": lambda column, value: np.isin(column, list(value)),
+}
+
+
+def build_features(exec_answers: np.ndarray, mgr_answers: np.ndarray = None,
+                   business_type=None, scale=None, rules: ScoringRules = None) -> pd.DataFrame:
+    """回答の配列から提案判定用の特徴量を一括で作成（mgr_answers を渡すとデュアル診断）"""
+    rules = rules or get_rules()
+    exec_scores = score_matrix(exec_answers, rules)
+    n = len(exec_answers)
+    features = {}
+
+    if mgr_answers is None:
+        view = exec_scores
+        features["quadrant"] = np.asarray(QUADRANTS)[exec_scores["quadrant"]]
+        gaps = np.full((n, len(CATEGORIES)), np.nan)
+        avg_gap = np.full(n, np.nan)
+    else:
+        view = score_matrix(mgr_answers, rules)
+        features["exec_quadrant"] = np.asarray(QUADRANTS)[exec_scores["quadrant"]]
+        features["mgr_quadrant"] = np.asarray(QUADRANTS)[view["quadrant"]]
+        features["quadrant"] = features["mgr_quadrant"]
+        gaps = exec_scores["radar_scores"] - view["radar_scores"]
+        avg_gap = gap_matrix(exec_answers, mgr_answers)["avg_gap"]
+
+    features["soft_score"] = view["soft_score"]
+    features["hard_score"] = view["hard_score"]
+    for j, cat in enumerate(CATEGORIES):
+        features[f"cat:{cat}"] = view["radar_scores"][:, j]
+        features[f"gap:{cat}"] = gaps[:, j]
+    features["avg_gap"] = avg_gap
+    features["business_type"] = np.broadcast_to(np.asarray(business_type if business_type is not None else ""), (n,))
+    features["scale"] = np.broadcast_to(np.asarray(scale if scale is not None else ""), (n,))
+    return pd.DataFrame(features)
+
+
+class RecommendationEngine:
+    """ルール表をコンパイルし、特徴量の表に対して一括で評価する"""
+
+    def __init__(self, table: list = None, scoring_rules: ScoringRules = None):
+        self.scoring_rules = scoring_rules or get_rules()
+        self.rules = sorted(table if table is not None else RECOMMENDATION_RULES, key=lambda r: r["priority"])
+        self._predicates = [self._compile(rule) for rule in self.rules]
+
+    def _resolve(self, value):
+        if isinstance(value, str) and value.startswith("$"):
+            return getattr(self.scoring_rules, value[1:])
+        return value
+
+    def _compile(self, rule: dict):
+        conditions = []
+        for feature, op, value in rule["when"]:
+            if op not in _OPERATORS:
+                raise ValueError(f"{rule['id']}: unknown operator {op}")
+            conditions.append((feature, _OPERATORS[op], self._resolve(value)))
+
+        def predicate(features: pd.DataFrame) -> np.ndarray:
+            result = np.ones(len(features), dtype=bool)
+            for feature, compare, value in conditions:
+                if feature not in features:
+                    return np.zeros(len(features), dtype=bool)
+                result &= compare(features[feature].to_numpy(), value)
+            return result
+
+        return predicate
+
+    def evaluate(self, features: pd.DataFrame) -> np.ndarray:
+        """(件数, ルール数) の真偽値行列を返す"""
+        if not self.rules:
+            return np.zeros((len(features), 0), dtype=bool)
+        return np.column_stack([predicate(features) for predicate in self._predicates])
+
+    def recommend(self, features: pd.DataFrame, groups=None) -> list:
+        """各行について該当するルールを優先度順に返す"""
+        hits = self.evaluate(features)
+        allowed = np.array([groups is None or rule["group"] in groups for rule in self.rules], dtype=bool)
+        hits = hits & allowed
+        return [[self.rules[j] for j in np.flatnonzero(row)] for row in hits]
+
+    def hit_counts(self, features: pd.DataFrame) -> dict:
+        """ルールごとの該当件数（一括処理の集計用）"""
+        counts = self.evaluate(features).sum(axis=0)
+        return {rule["id"]: int(count) for rule, count in zip(self.rules, counts)}
+
+
+@lru_cache(maxsize=None)
+def get_engine(rules_version: str = None) -> RecommendationEngine:
+    """スコアリングルールのバージョンごとにコンパイル済みのエンジンを返す"""
+    return RecommendationEngine(scoring_rules=get_rules(rules_version))
+
+
+def main():
+    from archive import ROLES, clean_mask, load_archive
+
+    parser = argparse.ArgumentParser(description="アーカイブ全体に改善提案ルールを一括適用")
+    parser.add_argument("--archive", help="アーカイブのディレクトリ")
+    parser.add_argument("--include-flagged", action="store_true", help="スクリーニングで除外された行も含める")
+    args = parser.parse_args()
+
+    columns = load_archive(args.archive)
+    mask = np.ones(len(columns["role"]), dtype=bool) if args.include_flagged else clean_mask(columns)
+    answers = np.asarray(columns["answers"])
+    role = np.asarray(columns["role"])
+    pair = np.asarray(columns["pair"])
+    engine = get_engine()
+
+    single_rows = np.flatnonzero(mask & (role == ROLES.index("single")))
+    manager_rows = np.flatnonzero(mask & (pair >= 0))
+    batches = {
+        "single": build_features(answers[single_rows], None,
+                                 columns["business_type"][single_rows], columns["scale"][single_rows]),
+        "dual": build_features(answers[pair[manager_rows]], answers[manager_rows],
+                               columns["business_type"][manager_rows], columns["scale"][manager_rows]),
+    }
+    for name, features in batches.items():
+        print(f"[{name}] {len(features)} 件")
+        for rule_id, count in engine.hit_counts(features).items():
+            if count:
+                print(f"  {rule_id:<30} {count}")
+
+
+if __name__ == "__main__":
+    main()
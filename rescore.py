@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+アーカイブの再スコアリング
+Multi-core re-scoring of the archive when scoring rules change
+
+アーカイブを行範囲（シャード）に分割してプロセスプールで並列に再計算し、
+旧ルール・新ルールの判定を並べて出力します。入力列はメモリマップで各ワーカーから
+コピーなしで参照し、出力列も各ワーカーが自分の行範囲へ直接書き込みます。
+
+出力（data/rescore/<旧>-to-<新>-<アーカイブ版>/）:
+- {old,new}_soft.npy / {old,new}_hard.npy   float32  100点換算スコア
+- {old,new}_quadrant.npy                   int8     QUADRANTS のインデックス
+- {old,new}_gap_level.npy                  int8     GAP_LEVELS のインデックス（管理者の行以外は -1）
+- summary.json                             変更件数と遷移行列
+
+使い方:
+    python rescore.py --old v1 --new-file rules_v2.json --workers 8
+"""
+
+import os
+
+# ワーカー内の BLAS スレッドとプロセスプールが競合しないよう1スレッドに固定
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from archive import archive_dir, load_column, load_manifest
+from scoring import GAP_LEVELS, QUADRANTS, gap_level_codes, gap_matrix, score_matrix
+from scoring_rules import ScoringRules, get_rules, load_rules
+
+DEFAULT_OUTPUT_DIR = os.path.join("data", "rescore")
+CHUNK_ROWS = 1_000_000     # ワーカー内で一度に計算する行数
+SHARDS_PER_WORKER = 4      # 負荷の偏りをならすためのシャード数
+
+OUTPUT_COLUMNS = {
+    "soft": np.float32,
+    "hard": np.float32,
+    "quadrant": np.int8,
+    "gap_level": np.int8,
+}
+
+
+def _output_path(out_dir: str, prefix: str, name: str) -> str:
+    return os.path.join(out_dir, f"{prefix}_{name}.npy")
+
+
+def _rescore_shard(archive_path: str, out_dir: str, start: int, stop: int,
+                   old_rules: ScoringRules, new_rules: ScoringRules) -> dict:
+    """1シャード分を新旧ルールで再計算し、出力列へ書き込む（ワーカープロセスで実行）"""
+    answers = load_column("answers", archive_path)
+    pair = load_column("pair", archive_path)
+    rules_by_prefix = {"old": old_rules, "new": new_rules}
+    outputs = {
+        (prefix, name): np.load(_output_path(out_dir, prefix, name), mmap_mode="r+")
+        for prefix in rules_by_prefix for name in OUTPUT_COLUMNS
+    }
+
+    quadrant_transitions = np.zeros(len(QUADRANTS) ** 2, dtype=np.int64)
+    gap_transitions = np.zeros(len(GAP_LEVELS) ** 2, dtype=np.int64)
+
+    for chunk_start in range(start, stop, CHUNK_ROWS):
+        rows = slice(chunk_start, min(chunk_start + CHUNK_ROWS, stop))
+        block = np.asarray(answers[rows])
+        pairs = np.asarray(pair[rows])
+        paired = pairs >= 0
+        avg_gaps = None
+        if paired.any():
+            avg_gaps = gap_matrix(answers[pairs[paired]], block[paired])["avg_gap"]
+
+        codes = {}
+        for prefix, rules in rules_by_prefix.items():
+            scores = score_matrix(block, rules)
+            outputs[(prefix, "soft")][rows] = scores["soft_score"]
+            outputs[(prefix, "hard")][rows] = scores["hard_score"]
+            outputs[(prefix, "quadrant")][rows] = scores["quadrant"]
+            levels = np.full(len(block), -1, dtype=np.int8)
+            if avg_gaps is not None:
+                levels[paired] = gap_level_codes(avg_gaps, rules)
+            outputs[(prefix, "gap_level")][rows] = levels
+            codes[prefix] = (scores["quadrant"], levels)
+
+        quadrant_transitions += np.bincount(
+            codes["old"][0].astype(np.int64) * len(QUADRANTS) + codes["new"][0],
+            minlength=len(QUADRANTS) ** 2
+        )
+        if paired.any():
+            gap_transitions += np.bincount(
+                codes["old"][1][paired].astype(np.int64) * len(GAP_LEVELS) + codes["new"][1][paired],
+                minlength=len(GAP_LEVELS) ** 2
+            )
+
+    for array in outputs.values():
+        array.flush()
+    return {"quadrant": quadrant_transitions, "gap_level": gap_transitions}
+
+
+def _transition_table(counts: np.ndarray, labels: list) -> dict:
+    matrix = counts.reshape(len(labels), len(labels))
+    return {
+        old: {new: int(matrix[i, j]) for j, new in enumerate(labels) if matrix[i, j]}
+        for i, old in enumerate(labels)
+    }
+
+
+def rescore(old_rules: ScoringRules, new_rules: ScoringRules, workers: int = None,
+            archive_path: str = None, output_root: str = DEFAULT_OUTPUT_DIR) -> dict:
+    """アーカイブ全体を新旧ルールで再計算し、出力ディレクトリとサマリを返す"""
+    archive_path = archive_dir(archive_path)
+    manifest = load_manifest(archive_path)
+    rows = manifest["rows"]
+    if rows == 0:
+        raise ValueError(f"archive is empty: {archive_path}")
+    workers = workers or os.cpu_count() or 1
+
+    out_dir = os.path.join(output_root, f"{old_rules.version}-to-{new_rules.version}-{manifest['version']}")
+    os.makedirs(out_dir, exist_ok=True)
+    for prefix in ("old", "new"):
+        for name, dtype in OUTPUT_COLUMNS.items():
+            np.lib.format.open_memmap(
+                _output_path(out_dir, prefix, name), mode="w+", dtype=dtype, shape=(rows,)
+            ).flush()
+
+    n_shards = max(1, min(rows, workers * SHARDS_PER_WORKER))
+    bounds = np.linspace(0, rows, n_shards + 1, dtype=np.int64)
+    shards = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    started = time.perf_counter()
+    quadrant_counts = np.zeros(len(QUADRANTS) ** 2, dtype=np.int64)
+    gap_counts = np.zeros(len(GAP_LEVELS) ** 2, dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_rescore_shard, archive_path, out_dir, start, stop, old_rules, new_rules)
+            for start, stop in shards
+        ]
+        for future in futures:
+            result = future.result()
+            quadrant_counts += result["quadrant"]
+            gap_counts += result["gap_level"]
+    elapsed = time.perf_counter() - started
+
+    unchanged_quadrant = int(np.trace(quadrant_counts.reshape(len(QUADRANTS), -1)))
+    unchanged_gap = int(np.trace(gap_counts.reshape(len(GAP_LEVELS), -1)))
+    summary = {
+        "archive_version": manifest["version"],
+        "old_rules": old_rules.to_dict(),
+        "new_rules": new_rules.to_dict(),
+        "rows": rows,
+        "workers": workers,
+        "elapsed_seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed > 0 else None,
+        "quadrant_changed": rows - unchanged_quadrant,
+        "quadrant_transitions": _transition_table(quadrant_counts, QUADRANTS),
+        "gap_level_changed": int(gap_counts.sum()) - unchanged_gap,
+        "gap_level_transitions": _transition_table(gap_counts, GAP_LEVELS),
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return {"output_dir": out_dir, "summary": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スコアリングルール変更時のアーカイブ再計算")
+    parser.add_argument("--old", default=None, help="旧ルールのバージョン（省略時は現行ルール）")
+    parser.add_argument("--new", default=None, help="新ルールのバージョン")
+    parser.add_argument("--new-file", help="新ルールを JSON ファイルから読み込む")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカープロセス数（既定: CPU 数）")
+    parser.add_argument("--archive", help="アーカイブのディレクトリ")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="出力先のルートディレクトリ")
+    args = parser.parse_args()
+
+    if bool(args.new) == bool(args.new_file):
+        parser.error("specify exactly one of --new or --new-file")
+    old_rules = get_rules(args.old)
+    new_rules = load_rules(args.new_file) if args.new_file else get_rules(args.new)
+
+    result = rescore(old_rules, new_rules, args.workers, args.archive, args.output)
+    summary = result["summary"]
+    print(f"{summary['rows']} rows in {summary['elapsed_seconds']:.1f}s "
+          f"({summary['workers']} workers) -> {result['output_dir']}")
+    print(f"象限が変わった件数: {summary['quadrant_changed']} / "
+          f"ギャップレベルが変わった件数: {summary['gap_level_changed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+診断スコアリング
+Question bank, scoring and gap analysis
+
+Streamlit に依存しないため、UI 以外（API・バッチ処理など）からも利用できます。
+"""
+
+import numbers
+
+import numpy as np
+import pandas as pd
+
+from scoring_rules import ScoringRules, get_rules
+
+# 質問データの定義（拡充版）
+SOFT_QUESTIONS = [
+    {
+        "id": "soft_1",
+        "category": "人材定着",
+        "question": "職員間のコミュニケーションは活発ですか？",
+        "description": "日常的な会話、情報共有、相談のしやすさを評価"
+    },
+    {
+        "id": "soft_2",
+        "category": "人材定着",
+        "question": "退職理由のヒアリング・記録を行っていますか？",
+        "description": "退職者への面談実施と記録の有無を評価"
+    },
+    {
+        "id": "soft_3",
+        "category": "育成",
+        "question": "新人職員への教育体制は整っていますか？",
+        "description": "OJT計画、マニュアル、メンター制度の有無を評価"
+    },
+    {
+        "id": "soft_4",
+        "category": "育成",
+        "question": "管理者のマネジメント能力は十分ですか？",
+        "description": "経営数字の理解、部下育成、方針の翻訳力を評価"
+    },
+    {
+        "id": "soft_5",
+        "category": "理念",
+        "question": "法人の理念・ビジョンは職員に浸透していますか？",
+        "description": "理念の説明機会、日常業務への反映度を評価"
+    },
+    {
+        "id": "soft_6",
+        "category": "コミュニケーション",
+        "question": "経営者と現場職員が直接会話する機会はありますか？",
+        "description": "経営層と現場の接点頻度を評価"
+    },
+    {
+        "id": "soft_7",
+        "category": "コミュニケーション",
+        "question": "職員が上司に「言いにくいこと」を言える環境ですか？",
+        "description": "心理的安全性、1on1面談、匿名アンケートの有無を評価"
+    },
+]
+
+HARD_QUESTIONS = [
+    {
+        "id": "hard_1",
+        "category": "人員基準",
+        "question": "人員配置基準を常に満たしていますか？",
+        "description": "常勤換算の計算、基準遵守状況を評価"
+    },
+    {
+        "id": "hard_2",
+        "category": "人員基準",
+        "question": "サービス管理責任者の配置は適正ですか？",
+        "description": "資格要件、配置基準の遵守を評価"
+    },
+    {
+        "id": "hard_3",
+        "category": "記録",
+        "question": "個別支援計画は定期的に更新されていますか？",
+        "description": "6ヶ月ごとの見直し、モニタリング記録を評価"
+    },
+    {
+        "id": "hard_4",
+        "category": "記録",
+        "question": "サービス提供記録は適切に作成されていますか？",
+        "description": "当日記録、内容の正確性、保管状況を評価"
+    },
+    {
+        "id": "hard_5",
+        "category": "安全管理",
+        "question": "虐待防止委員会は設置・運営されていますか？",
+        "description": "委員会設置、定期開催、研修実施を評価"
+    },
+    {
+        "id": "hard_6",
+        "category": "安全管理",
+        "question": "BCP（業務継続計画）は策定・訓練されていますか？",
+        "description": "BCP策定、年1回以上の訓練実施を評価"
+    },
+    {
+        "id": "hard_7",
+        "category": "加算管理",
+        "question": "取得可能な加算を把握・算定できていますか？",
+        "description": "加算要件の理解、算定漏れの有無を評価"
+    },
+]
+
+# 象限の定義
+QUADRANT_DEFINITIONS = {
+    "ホワイト優良経営": {
+        "description": "組織も法令遵守も高水準。継続的な改善で更なる成長を。",
+        "color": "#38A169",
+        "recommendation": "現状維持しつつ、次のステージへの投資を検討してください。"
+    },
+    "砂上の楼閣": {
+        "description": "収益は上がっているが、人が離れるリスクあり。",
+        "color": "#ECC94B",
+        "recommendation": "組織マネジメントの強化が急務です。一斉退職リスクに注意。"
+    },
+    "万年貧乏": {
+        "description": "人は良いが、稼げていない・記録不備のリスクあり。",
+        "color": "#ED8936",
+        "recommendation": "加算取得の最適化、記録体制の整備を優先してください。"
+    },
+    "崩壊寸前": {
+        "description": "組織・法令の両面で危機的状況。即時介入が必要。",
+        "color": "#E53E3E",
+        "recommendation": "専門家への相談を強く推奨します。優先順位を付けた改善を。"
+    }
+}
+
+# 回答のコンパクト表現：質問バンクの列順に1問1バイト（0は未回答）
+QUESTION_IDS = [q["id"] for q in SOFT_QUESTIONS + HARD_QUESTIONS]
+QUESTION_INDEX = {qid: i for i, qid in enumerate(QUESTION_IDS)}
+N_QUESTIONS = len(QUESTION_IDS)
+N_SOFT = len(SOFT_QUESTIONS)
+UNANSWERED = 0
+DEFAULT_SCORE = 3
+
+# レーダーチャートのカテゴリ（表示順）
+CATEGORIES = ["人材定着", "育成", "理念", "コミュニケーション", "人員基準", "記録", "安全管理", "加算管理"]
+
+# 象限・ギャップレベル（一括処理ではこの順のインデックスで表す）
+QUADRANTS = list(QUADRANT_DEFINITIONS)
+GAP_LEVELS = ["小", "中", "大"]
+
+# 質問 × カテゴリの平均化行列（一括処理用）
+_CATEGORY_WEIGHTS = np.zeros((N_QUESTIONS, len(CATEGORIES)))
+for _i, _q in enumerate(SOFT_QUESTIONS + HARD_QUESTIONS):
+    _CATEGORY_WEIGHTS[_i, CATEGORIES.index(_q["category"])] = 1
+_CATEGORY_WEIGHTS /= _CATEGORY_WEIGHTS.sum(axis=0)
+
+
+def encode_responses(responses) -> bytes:
+    """回答（辞書）を固定長のバイト列に変換"""
+    if isinstance(responses, (bytes, bytearray)):
+        return bytes(responses)
+    if not isinstance(responses, dict):
+        raise TypeError(f"responses must be a dict, got {type(responses).__name__}")
+    answers = bytearray(N_QUESTIONS)
+    for qid, score in responses.items():
+        if qid not in QUESTION_INDEX:
+            raise ValueError(f"unknown question: {qid}")
+        if isinstance(score, bool) or not isinstance(score, numbers.Integral):
+            raise ValueError(f"{qid}: score must be an integer, got {score!r}")
+        score = int(score)
+        if not 1 <= score <= 5:
+            raise ValueError(f"{qid}: score must be between 1 and 5, got {score}")
+        answers[QUESTION_INDEX[qid]] = score
+    return bytes(answers)
+
+
+def decode_responses(answers) -> dict:
+    """固定長のバイト列を回答（辞書）に戻す"""
+    return {qid: answers[i] for i, qid in enumerate(QUESTION_IDS) if answers[i] != UNANSWERED}
+
+
+def get_answer(responses, qid: str, default: int = DEFAULT_SCORE) -> int:
+    """回答（辞書またはバイト列）から1問分のスコアを取得"""
+    if isinstance(responses, (bytes, bytearray)):
+        return responses[QUESTION_INDEX[qid]] or default
+    return responses.get(qid, default)
+
+
+def calculate_scores(responses, rules: ScoringRules = None) -> dict:
+    """回答からスコアを計算"""
+    rules = rules or get_rules()
+    soft_scores = []
+    hard_scores = []
+    
+    category_scores = {cat: [] for cat in CATEGORIES}
+    
+    for q in SOFT_QUESTIONS:
+        score = get_answer(responses, q["id"])
+        soft_scores.append(score)
+        if q["category"] in category_scores:
+            category_scores[q["category"]].append(score)
+    
+    for q in HARD_QUESTIONS:
+        score = get_answer(responses, q["id"])
+        hard_scores.append(score)
+        if q["category"] in category_scores:
+            category_scores[q["category"]].append(score)
+    
+    # 各カテゴリの平均を計算
+    radar_scores = {}
+    for cat, scores in category_scores.items():
+        radar_scores[cat] = np.mean(scores) if scores else 0
+    
+    # 総合スコア（100点満点に変換）
+    soft_total = (np.mean(soft_scores) / rules.score_max) * 100 if soft_scores else 0
+    hard_total = (np.mean(hard_scores) / rules.score_max) * 100 if hard_scores else 0
+    
+    return {
+        "soft_score": soft_total,
+        "hard_score": hard_total,
+        "radar_scores": radar_scores,
+        "soft_raw": soft_scores,
+        "hard_raw": hard_scores
+    }
+
+
+def determine_quadrant(soft_score: float, hard_score: float, rules: ScoringRules = None) -> str:
+    """スコアから象限を判定"""
+    threshold = (rules or get_rules()).quadrant_threshold
+    
+    if soft_score >= threshold and hard_score >= threshold:
+        return "ホワイト優良経営"
+    elif soft_score < threshold and hard_score >= threshold:
+        return "砂上の楼閣"
+    elif soft_score >= threshold and hard_score < threshold:
+        return "万年貧乏"
+    else:
+        return "崩壊寸前"
+
+
+def calculate_gap_analysis(exec_responses, mgr_responses) -> pd.DataFrame:
+    """経営者と管理者の回答ギャップを分析"""
+    all_questions = SOFT_QUESTIONS + HARD_QUESTIONS
+    gaps = []
+    
+    for q in all_questions:
+        qid = q["id"]
+        exec_score = get_answer(exec_responses, qid)
+        mgr_score = get_answer(mgr_responses, qid)
+        gap = exec_score - mgr_score
+        
+        q_type = "Soft" if qid.startswith("soft") else "Hard"
+        
+        gaps.append({
+            "id": qid,
+            "category": q["category"],
+            "question": q["question"],
+            "type": q_type,
+            "executive_score": exec_score,
+            "manager_score": mgr_score,
+            "gap": gap,
+            "abs_gap": abs(gap)
+        })
+    
+    return pd.DataFrame(gaps)
+
+
+def gap_level(avg_gap: float, rules: ScoringRules = None) -> str:
+    """平均ギャップからギャップレベル（大・中・小）を判定"""
+    rules = rules or get_rules()
+    return "大" if avg_gap >= rules.gap_level_high else ("中" if avg_gap >= rules.gap_level_medium else "小")
+
+
+def answers_matrix(rows) -> np.ndarray:
+    """コンパクト形式の回答の並びを (N, 14) の uint8 配列に変換"""
+    buffer = b"".join(encode_responses(r) for r in rows)
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(-1, N_QUESTIONS)
+
+
+def quadrant_codes(soft_scores: np.ndarray, hard_scores: np.ndarray,
+                   rules: ScoringRules = None) -> np.ndarray:
+    """determine_quadrant の一括版（QUADRANTS のインデックスを返す）"""
+    threshold = (rules or get_rules()).quadrant_threshold
+    soft_ok = soft_scores >= threshold
+    hard_ok = hard_scores >= threshold
+    return np.select(
+        [soft_ok & hard_ok, ~soft_ok & hard_ok, soft_ok & ~hard_ok],
+        [0, 1, 2],
+        default=3
+    ).astype(np.int8)
+
+
+def score_matrix(answers: np.ndarray, rules: ScoringRules = None) -> dict:
+    """calculate_scores / determine_quadrant の一括版"""
+    rules = rules or get_rules()
+    filled = np.where(answers == UNANSWERED, DEFAULT_SCORE, answers).astype(np.float64)
+    soft_scores = filled[:, :N_SOFT].mean(axis=1) / rules.score_max * 100
+    hard_scores = filled[:, N_SOFT:].mean(axis=1) / rules.score_max * 100
+    return {
+        "soft_score": soft_scores,
+        "hard_score": hard_scores,
+        "radar_scores": filled @ _CATEGORY_WEIGHTS,
+        "quadrant": quadrant_codes(soft_scores, hard_scores, rules),
+    }
+
+
+def gap_matrix(exec_answers: np.ndarray, mgr_answers: np.ndarray) -> dict:
+    """calculate_gap_analysis の一括版"""
+    exec_filled = np.where(exec_answers == UNANSWERED, DEFAULT_SCORE, exec_answers).astype(np.int8)
+    mgr_filled = np.where(mgr_answers == UNANSWERED, DEFAULT_SCORE, mgr_answers).astype(np.int8)
+    gaps = exec_filled - mgr_filled
+    return {
+        "gap": gaps,
+        "avg_gap": np.abs(gaps).mean(axis=1),
+    }
+
+
+def gap_level_codes(avg_gaps: np.ndarray, rules: ScoringRules = None) -> np.ndarray:
+    """gap_level の一括版（GAP_LEVELS のインデックスを返す）"""
+    rules = rules or get_rules()
+    return ((avg_gaps >= rules.gap_level_medium).astype(np.int8)
+            + (avg_gaps >= rules.gap_level_high).astype(np.int8))
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+"""
+スコアリング HTTP API
+Asyncio HTTP scoring API for partner systems
+
+Streamlit UI を介さずに、外部システム（人事システム・アンケート基盤など）から
+回答を送信してスコア・象限・ギャップ分析を取得するための軽量サービスです。
+標準ライブラリの asyncio のみで動作し、ローカルで完結します。
+
+エンドポイント:
+- GET  /healthz          死活監視
+- POST /v1/score         1件のスコアリング
+    {"responses": {"soft_1": 4, ...}}                       シングル診断
+    {"executive": {...}, "manager": {...}}                  デュアル診断（ギャップ分析付き）
+- POST /v1/score/batch   一括スコアリング {"items": [...]}
+    STREAM_THRESHOLD 件を超える場合、または ?stream=1 の場合は NDJSON でストリーミング返却
+- GET  /v1/export        アーカイブの一括エクスポート（ZIP）をストリーミングでダウンロード
+    分析担当者向けのため、Authorization: Bearer <WRD_ADMIN_TOKEN> が必要
+
+同一入力の同時リクエストは1回の計算にまとめ（コアレッシング）、異なる入力も
+同じイベントループ周回のものはまとめて一括計算します。
+
+使い方:
+    python scoring_api.py serve --port 8600
+    python scoring_api.py bench --requests 5000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from archive import load_manifest
+from export import build_export, iter_file
+from profiling import is_admin
+from scoring import (
+    CATEGORIES, QUADRANTS, QUESTION_IDS, answers_matrix, encode_responses,
+    gap_level, gap_matrix, score_matrix,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8600
+MAX_BODY_BYTES = 64 * 1024 * 1024
+STREAM_THRESHOLD = 1000   # これを超える一括リクエストはストリーミングで返却
+STREAM_CHUNK_ROWS = 2000  # ストリーミング時に一度に計算する行数
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    """HTTP エラー応答に変換される例外"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _encode_field(item: dict, name: str) -> bytes:
+    value = item[name]
+    if not isinstance(value, dict):
+        raise ValueError(f"'{name}' must be an object")
+    return encode_responses(value)
+
+
+def parse_item(item) -> tuple:
+    """リクエストの1件をコアレッシング用のキー（経営者・管理者の回答バイト列）に変換"""
+    if not isinstance(item, dict):
+        raise ValueError("item must be an object")
+    if "executive" in item or "manager" in item:
+        if "executive" not in item or "manager" not in item:
+            raise ValueError("dual items require both 'executive' and 'manager'")
+        return _encode_field(item, "executive"), _encode_field(item, "manager")
+    if "responses" in item:
+        return _encode_field(item, "responses"), None
+    raise ValueError("item requires 'responses' or 'executive'/'manager'")
+
+
+def _score_row(scores: dict, row: int) -> dict:
+    return {
+        "soft_score": float(scores["soft_score"][row]),
+        "hard_score": float(scores["hard_score"][row]),
+        "quadrant": QUADRANTS[scores["quadrant"][row]],
+        "radar_scores": dict(zip(CATEGORIES, scores["radar_scores"][row].tolist())),
+    }
+
+
+def score_items(items: list) -> list:
+    """parse_item のキーの並びを一括でスコアリングし、結果を同じ順で返す"""
+    results = [None] * len(items)
+    single_rows = [i for i, (_, mgr) in enumerate(items) if mgr is None]
+    dual_rows = [i for i, (_, mgr) in enumerate(items) if mgr is not None]
+
+    if single_rows:
+        scores = score_matrix(answers_matrix(items[i][0] for i in single_rows))
+        for j, i in enumerate(single_rows):
+            results[i] = _score_row(scores, j)
+
+    if dual_rows:
+        exec_answers = answers_matrix(items[i][0] for i in dual_rows)
+        mgr_answers = answers_matrix(items[i][1] for i in dual_rows)
+        exec_scores = score_matrix(exec_answers)
+        mgr_scores = score_matrix(mgr_answers)
+        gaps = gap_matrix(exec_answers, mgr_answers)
+        for j, i in enumerate(dual_rows):
+            avg_gap = float(gaps["avg_gap"][j])
+            results[i] = {
+                "executive": _score_row(exec_scores, j),
+                "manager": _score_row(mgr_scores, j),
+                "gap_analysis": {
+                    "avg_gap": avg_gap,
+                    "gap_level": gap_level(avg_gap),
+                    "quadrant_mismatch": bool(exec_scores["quadrant"][j] != mgr_scores["quadrant"][j]),
+                    "gaps": dict(zip(QUESTION_IDS, gaps["gap"][j].tolist())),
+                },
+            }
+    return results
+
+
+class Coalescer:
+    """同一入力の同時リクエストを1回の計算にまとめ、同じループ周回の入力を一括計算する"""
+
+    def __init__(self):
+        self._pending = {}    # まだ計算を始めていないキー -> Future
+        self._inflight = {}   # 計算中のキー -> Future
+        self._scheduled = False
+        self._tasks = set()
+        self.requests = 0
+        self.computed = 0
+
+    async def score(self, key: tuple) -> dict:
+        loop = asyncio.get_running_loop()
+        self.requests += 1
+        future = self._pending.get(key) or self._inflight.get(key)
+        if future is None:
+            future = loop.create_future()
+            self._pending[key] = future
+            if not self._scheduled:
+                self._scheduled = True
+                loop.call_soon(self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        batch, self._pending = self._pending, {}
+        self._scheduled = False
+        self._inflight.update(batch)
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict):
+        keys = list(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, score_items, keys)
+        except Exception as exc:
+            for key in keys:
+                if not batch[key].done():
+                    batch[key].set_exception(exc)
+        else:
+            self.computed += len(keys)
+            for key, result in zip(keys, results):
+                if not batch[key].done():
+                    batch[key].set_result(result)
+        finally:
+            for key in keys:
+                self._inflight.pop(key, None)
+
+
+class ScoringServer:
+    """asyncio による最小限の HTTP/1.1 サーバ（keep-alive・chunked 応答対応）"""
+
+    def __init__(self):
+        self.coalescer = Coalescer()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HTTPError as exc:
+                    await _write_json(writer, exc.status, {"error": exc.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    await self._dispatch(writer, method, target, headers, body, keep_alive)
+                except HTTPError as exc:
+                    await _write_json(writer, exc.status, {"error": exc.message}, keep_alive)
+                except Exception as exc:  # 想定外のエラーでも接続は維持しない
+                    await _write_json(writer, 500, {"error": str(exc)}, keep_alive=False)
+                    break
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:  # サーバ停止時は処理中の接続を閉じて終了する
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    async def _dispatch(self, writer, method: str, target: str, headers: dict, body: bytes,
+                        keep_alive: bool):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if url.path == "/healthz":
+            await _write_json(writer, 200, {
+                "status": "ok",
+                "requests": self.coalescer.requests,
+                "computed": self.coalescer.computed,
+            }, keep_alive)
+            return
+
+        if url.path == "/v1/export":
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            scheme, _, token = headers.get("authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not is_admin(token.strip()):
+                raise HTTPError(403, "export requires the admin token")
+            await self._stream_export(writer, keep_alive)
+            return
+
+        if url.path not in ("/v1/score", "/v1/score/batch"):
+            raise HTTPError(404, f"unknown path: {url.path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError as exc:
+            raise HTTPError(400, f"invalid JSON: {exc}")
+
+        if url.path == "/v1/score":
+            try:
+                key = parse_item(payload)
+            except (ValueError, KeyError, TypeError) as exc:
+                raise HTTPError(400, str(exc))
+            await _write_json(writer, 200, await self.coalescer.score(key), keep_alive)
+            return
+
+        items = payload.get("items") if isinstance(payload, dict) else None
+        if not isinstance(items, list):
+            raise HTTPError(400, "'items' must be a list")
+        keys = []
+        for index, item in enumerate(items):
+            try:
+                keys.append(parse_item(item))
+            except (ValueError, KeyError, TypeError) as exc:
+                raise HTTPError(400, f"items[{index}]: {exc}")
+
+        loop = asyncio.get_running_loop()
+        stream = query.get("stream", ["0"])[0] == "1" or len(keys) > STREAM_THRESHOLD
+        if not stream:
+            results = await loop.run_in_executor(None, score_items, keys)
+            await _write_json(writer, 200, {"results": results}, keep_alive)
+            return
+
+        await _write_head(writer, 200, "application/x-ndjson", keep_alive, chunked=True)
+        for start in range(0, len(keys), STREAM_CHUNK_ROWS):
+            chunk = keys[start:start + STREAM_CHUNK_ROWS]
+            results = await loop.run_in_executor(None, score_items, chunk)
+            lines = "".join(
+                json.dumps({"index": start + i, **result}, ensure_ascii=False) + "\n"
+                for i, result in enumerate(results)
+            )
+            await _write_chunk(writer, lines.encode("utf-8"))
+        await _write_chunk(writer, b"")
+
+    async def _stream_export(self, writer, keep_alive: bool):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, load_manifest)
+        except FileNotFoundError:
+            raise HTTPError(404, "archive has not been built (run: python archive.py build)")
+        path = await loop.run_in_executor(None, build_export)
+        chunks = iter_file(path)
+        await _write_head(writer, 200, "application/zip", keep_alive, chunked=True, extra_headers={
+            "Content-Disposition": f'attachment; filename="{os.path.basename(path)}"',
+        })
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, b"")
+            await _write_chunk(writer, chunk)
+            if not chunk:
+                break
+
+
+async def _read_request(reader):
+    """HTTP リクエストを1件読み込む（接続終了時は None）"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"body exceeds {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def _write_head(writer, status: int, content_type: str, keep_alive: bool,
+                      length: int = None, chunked: bool = False, extra_headers: dict = None):
+    lines = [
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    lines.extend(f"{name}: {value}" for name, value in (extra_headers or {}).items())
+    if chunked:
+        lines.append("Transfer-Encoding: chunked")
+    else:
+        lines.append(f"Content-Length: {length}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+
+async def _write_chunk(writer, data: bytes):
+    writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+    await writer.drain()
+
+
+async def _write_json(writer, status: int, obj, keep_alive: bool):
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    await _write_head(writer, status, "application/json; charset=utf-8", keep_alive, length=len(body))
+    writer.write(body)
+    await writer.drain()
+
+
+async def _read_response(reader) -> tuple:
+    """HTTP 応答を1件読み込む（ベンチマーク用クライアント）"""
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        parts = []
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            data = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            parts.append(data[:-2])
+        return status, b"".join(parts)
+    return status, await reader.readexactly(int(headers.get("content-length", 0)))
+
+
+def _request_bytes(path: str, payload) -> bytes:
+    body = json.dumps(payload).encode("utf-8")
+    head = (f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+def _random_item(rng: random.Random, dual: bool) -> dict:
+    def answers():
+        return {qid: rng.randint(1, 5) for qid in QUESTION_IDS}
+    if dual:
+        return {"executive": answers(), "manager": answers()}
+    return {"responses": answers()}
+
+
+async def run_benchmark(requests: int, concurrency: int, distinct: int,
+                        batch_requests: int, batch_size: int, seed: int) -> dict:
+    """ローカルにサーバを起動し、1件 API の req/s と一括 API の rows/s を計測"""
+    rng = random.Random(seed)
+    service = ScoringServer()
+    server = await service.start(DEFAULT_HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+
+    pool = [_request_bytes("/v1/score", _random_item(rng, dual=i % 2 == 1)) for i in range(distinct)]
+
+    async def single_client(count: int):
+        reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+        for _ in range(count):
+            writer.write(pool[rng.randrange(len(pool))])
+            status, _ = await _read_response(reader)
+            if status != 200:
+                raise RuntimeError(f"unexpected status {status}")
+        writer.close()
+        await writer.wait_closed()
+
+    # 端数は先頭の接続に1件ずつ割り振り、合計を requests に一致させる
+    concurrency = max(1, min(concurrency, requests))
+    per_client = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(single_client(count) for count in per_client))
+    single_elapsed = time.perf_counter() - started
+    single_total = sum(per_client)
+
+    batch_body = _request_bytes(
+        "/v1/score/batch?stream=1",
+        {"items": [_random_item(rng, dual=i % 2 == 1) for i in range(batch_size)]}
+    )
+    reader, writer = await asyncio.open_connection(DEFAULT_HOST, port)
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(batch_requests):
+        writer.write(batch_body)
+        status, body = await _read_response(reader)
+        if status != 200:
+            raise RuntimeError(f"unexpected status {status}")
+        rows += body.count(b"\n")
+    batch_elapsed = time.perf_counter() - started
+    writer.close()
+    await writer.wait_closed()
+
+    server.close()
+    await server.wait_closed()
+    return {
+        "single_requests": single_total,
+        "single_requests_per_s": single_total / single_elapsed,
+        "coalesced_ratio": 1 - service.coalescer.computed / max(service.coalescer.requests, 1),
+        "batch_rows": rows,
+        "batch_rows_per_s": rows / batch_elapsed,
+    }
+
+
+async def serve(host: str, port: int):
+    server = await ScoringServer().start(host, port)
+    print(f"scoring API listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="福祉経営リスク診断 スコアリング API")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="API サーバを起動")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    bench_parser = sub.add_parser("bench", help="ローカルでスループットを計測")
+    bench_parser.add_argument("--requests", type=int, default=5000, help="1件 API の総リクエスト数")
+    bench_parser.add_argument("--concurrency", type=int, default=64, help="同時接続数")
+    bench_parser.add_argument("--distinct", type=int, default=500,
+                              help="1件 API で使う入力の種類（少ないほどコアレッシングが効く）")
+    bench_parser.add_argument("--batch-requests", type=int, default=10, help="一括 API のリクエスト数")
+    bench_parser.add_argument("--batch-size", type=int, default=10000, help="一括 API の1リクエストあたりの件数")
+    bench_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port))
+        return
+
+    result = asyncio.run(run_benchmark(
+        args.requests, args.concurrency, args.distinct,
+        args.batch_requests, args.batch_size, args.seed
+    ))
+    print(f"1件 API:   {result['single_requests']} req / {result['single_requests_per_s']:.0f} req/s "
+          f"(コアレッシング率 {result['coalesced_ratio']:.1%})")
+    print(f"一括 API:  {result['batch_rows']} rows / {result['batch_rows_per_s']:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
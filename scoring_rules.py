@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+スコアリングルール定義（バージョン管理）
+Versioned scoring rules
+
+象限判定の境界・100点換算・ギャップレベルの境界をまとめて1つのバージョンとして管理します。
+ルールを調整するときは新しいバージョンを追加し、過去の判定は rescore.py で再計算します。
+"""
+
+import json
+from dataclasses import asdict, dataclass
+
+
+@dataclass(frozen=True)
+class ScoringRules:
+    """スコアリングルール"""
+    version: str
+    quadrant_threshold: float = 60   # 象限判定の境界（100点換算）
+    score_max: float = 5             # 100点換算時の満点
+    gap_level_high: float = 1.5      # 平均ギャップがこれ以上なら「大」
+    gap_level_medium: float = 0.8    # 平均ギャップがこれ以上なら「中」
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+RULES = {
+    "v1": ScoringRules(version="v1"),
+}
+CURRENT_RULES_VERSION = "v1"
+CURRENT_RULES = RULES[CURRENT_RULES_VERSION]
+
+
+def get_rules(version: str = None) -> ScoringRules:
+    """バージョンを指定してルールを取得（省略時は現行ルール）"""
+    if version is None:
+        return CURRENT_RULES
+    try:
+        return RULES[version]
+    except KeyError:
+        raise ValueError(f"unknown scoring rules version: {version}") from None
+
+
+def load_rules(path: str) -> ScoringRules:
+    """JSON ファイルからルールを読み込む（調整中の案を試すとき用）"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if "version" not in data:
+        raise ValueError(f"{path}: 'version' is required")
+    return ScoringRules(**data)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+不注意回答のスクリーニング
+Vectorized careless-response screening
+
+回答を (N, 14) の uint8 配列のまま一括で判定し、疑わしい回答にフラグ（ビットマスク）を付けます。
+スライダーの初期値は3で、calculate_scores も未回答を3として扱うため、
+未操作のフォームは「60点の回答」に見えてしまいます。フラグ付きの行は集計対象から除外します。
+"""
+
+import numpy as np
+
+from scoring import DEFAULT_SCORE, UNANSWERED
+
+FLAG_STRAIGHT_LINE = 1 << 0    # 全問が同じ値
+FLAG_ALL_DEFAULT = 1 << 1      # 全問が初期値（3）または未回答
+FLAG_LOW_VARIANCE = 1 << 2     # 初期値から動かした質問がごくわずか（ほぼ未操作）
+FLAG_PAIR_IDENTICAL = 1 << 3   # 経営者と管理者の回答が完全に一致
+FLAG_PAIR_INVERTED = 1 << 4    # 管理者の回答が経営者の回答を機械的に反転したもの（6 - x）
+
+FLAG_LABELS = {
+    FLAG_STRAIGHT_LINE: "全問が同じ値で回答されています",
+    FLAG_ALL_DEFAULT: "全問が初期値（3）のままです",
+    FLAG_LOW_VARIANCE: "ほとんどの質問が初期値（3）のままです",
+    FLAG_PAIR_IDENTICAL: "経営者と管理者の回答が完全に一致しています",
+    FLAG_PAIR_INVERTED: "管理者の回答が経営者の回答をそのまま反転した形になっています",
+}
+
+# 初期値（3）以外の回答がこの問数以下なら、ほぼ未操作のフォームとみなす。
+# 標準偏差では判定しない：14問・5段階では「4を13問＋5を1問」のような真面目な回答でも
+# 標準偏差が 0.3 未満になり、高得点の事業所ほど除外されてしまうため。
+LOW_VARIANCE_MAX_CHANGED = 1
+
+
+def _filled(answers: np.ndarray) -> np.ndarray:
+    return np.where(answers == UNANSWERED, DEFAULT_SCORE, answers)
+
+
+def screen_answers(answers: np.ndarray) -> np.ndarray:
+    """回答者ごとのフラグを一括判定"""
+    answers = np.asarray(answers, dtype=np.uint8)
+    filled = _filled(answers)
+    lo = filled.min(axis=1)
+    hi = filled.max(axis=1)
+    straight = lo == hi
+    all_default = straight & (lo == DEFAULT_SCORE)
+    changed = (filled != DEFAULT_SCORE).sum(axis=1)
+    low_variance = ~straight & (changed <= LOW_VARIANCE_MAX_CHANGED)
+
+    flags = np.zeros(len(answers), dtype=np.uint8)
+    flags |= np.where(straight, FLAG_STRAIGHT_LINE, 0).astype(np.uint8)
+    flags |= np.where(all_default, FLAG_ALL_DEFAULT, 0).astype(np.uint8)
+    flags |= np.where(low_variance, FLAG_LOW_VARIANCE, 0).astype(np.uint8)
+    return flags
+
+
+def screen_pairs(exec_answers: np.ndarray, mgr_answers: np.ndarray) -> np.ndarray:
+    """経営者・管理者の組ごとのフラグを一括判定"""
+    exec_filled = _filled(np.asarray(exec_answers, dtype=np.uint8))
+    mgr_filled = _filled(np.asarray(mgr_answers, dtype=np.uint8))
+    identical = (exec_filled == mgr_filled).all(axis=1)
+    # 全問3の組は反転しても同一になるため、反転ではなく一致として扱う
+    inverted = ~identical & ((exec_filled + mgr_filled) == 6).all(axis=1)
+
+    flags = np.zeros(len(exec_filled), dtype=np.uint8)
+    flags |= np.where(identical, FLAG_PAIR_IDENTICAL, 0).astype(np.uint8)
+    flags |= np.where(inverted, FLAG_PAIR_INVERTED, 0).astype(np.uint8)
+    return flags
+
+
+def describe_flags(flags: int) -> list:
+    """フラグを表示用の説明文に変換"""
+    return [label for flag, label in FLAG_LABELS.items() if flags & flag]
+
+
+def screen_one(answers: bytes) -> int:
+    """1人分の回答（コンパクト形式）のフラグ"""
+    return int(screen_answers(np.frombuffer(answers, dtype=np.uint8).reshape(1, -1))[0])
+
+
+def screen_pair(exec_answers: bytes, mgr_answers: bytes) -> int:
+    """経営者・管理者1組分（コンパクト形式）の組のフラグ"""
+    exec_row = np.frombuffer(exec_answers, dtype=np.uint8).reshape(1, -1)
+    mgr_row = np.frombuffer(mgr_answers, dtype=np.uint8).reshape(1, -1)
+    return int(screen_pairs(exec_row, mgr_row)[0])
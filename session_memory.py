@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+セッション毎のメモリ計測
+Per-session memory accounting
+
+セッションステートに保持するのは回答（コンパクト形式）と画面状態だけで、
+グラフ（Plotly Figure）や DataFrame などの派生オブジェクトは再実行ごとに生成し、保持しません。
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+def deep_sizeof(obj, _seen=None) -> int:
+    """オブジェクトのおおよその使用メモリ（バイト）を再帰的に計算
+
+    Figure は to_plotly_json() の辞書構造を再帰的に数える。検証器などの内部オブジェクトは
+    含まないため、実際の使用量より小さい値（下限）になる。
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, go.Figure):
+        return sys.getsizeof(obj) + deep_sizeof(obj.to_plotly_json(), _seen)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, _seen) for item in obj)
+    return size
+
+
+def session_memory_report(state: dict, session: str) -> dict:
+    """セッションステートの使用メモリを集計"""
+    state_bytes = {str(key): deep_sizeof(value) for key, value in state.items()}
+    return {
+        "session": session,
+        "session_state_bytes": state_bytes,
+        "total_bytes": sum(state_bytes.values()),
+    }
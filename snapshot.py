@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+統計量のスナップショット保存
+Periodic npz snapshots for in-memory streaming statistics
+
+ドリフト検知・相関分析のように、回答確定ごとにメモリ上で更新する統計量を
+一定間隔で npz ファイルに保存します。配列の取り出しだけを統計量のロック内で行い、
+ファイルへの書き込みはロックの外で1つずつ行うため、更新を止めることはありません。
+書き込みは一時ファイルに行い、完成後に置き換えます。
+"""
+
+import atexit
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+SAVE_INTERVAL = 30   # スナップショットを保存する最短間隔（秒）
+
+
+def write_npz(path: str, arrays: dict) -> None:
+    """配列を一時ファイルに書き、完成後に path へ置き換える"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Snapshot:
+    """統計量のスナップショットを保存する（path が None なら保存しない）
+
+    collect は lock を保持した状態で呼ばれ、保存する配列の辞書（コピー）を返す。
+    統計量を更新したら、同じ lock の中で dirty を True にする。
+    """
+
+    def __init__(self, path: str, lock: threading.Lock, collect, name: str, interval: float = SAVE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.dirty = False
+        self._lock = lock
+        self._collect = collect
+        self._name = name
+        self._save_lock = threading.Lock()   # スナップショットの書き込みは1つずつ
+        self._last_save = 0.0
+        if path:
+            atexit.register(self.maybe_save, force=True)
+
+    def maybe_save(self, force: bool = False):
+        """前回保存から一定時間経っていればスナップショットを保存"""
+        if not self.path:
+            return
+        with self._save_lock:
+            now = time.monotonic()
+            if not self.dirty or (not force and now - self._last_save < self.interval):
+                return
+            try:
+                self._write(self.path)
+            except OSError as exc:  # 保存に失敗しても回答の確定は止めない（次回再試行）
+                print(f"[{self._name}] failed to save {self.path}: {exc}", file=sys.stderr)
+                return
+            self._last_save = now
+
+    def save(self, path: str):
+        with self._save_lock:
+            self._write(path)
+
+    def _write(self, path: str):
+        with self._lock:
+            arrays = self._collect()
+            self.dirty = False
+        try:
+            write_npz(path, arrays)
+        except BaseException:
+            self.dirty = True
+            raise
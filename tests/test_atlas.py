@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""スコア空間アトラスのテスト"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from atlas import AXIS_QUESTIONS, N_LEVELS, compute_atlas, get_atlas, quadrant_share, uniform_prior
+from scoring import N_QUESTIONS, N_SOFT, QUADRANTS, quadrant_codes, score_matrix
+from scoring_rules import get_rules
+
+
+def _axis_vectors() -> np.ndarray:
+    """1軸（7問）の全回答ベクトル (5^7, 7)"""
+    index = np.arange(N_LEVELS ** AXIS_QUESTIONS)
+    return ((index[:, None] // N_LEVELS ** np.arange(AXIS_QUESTIONS)) % N_LEVELS + 1).astype(np.uint8)
+
+
+class ComputeAtlasTest(unittest.TestCase):
+
+    def test_uniform_prior_matches_brute_force(self):
+        rules = get_rules()
+        vectors = _axis_vectors()
+        answers = np.full((len(vectors), N_QUESTIONS), 5, dtype=np.uint8)
+        answers[:, :N_SOFT] = vectors
+        soft_scores = score_matrix(answers, rules)["soft_score"]
+        answers[:, :N_SOFT] = 5
+        answers[:, N_SOFT:] = vectors
+        hard_scores = score_matrix(answers, rules)["hard_score"]
+
+        # 5^14 通りの全回答を、Soft・Hard のスコアの組ごとにまとめて数える
+        soft_values, soft_counts = np.unique(soft_scores, return_counts=True)
+        hard_values, hard_counts = np.unique(hard_scores, return_counts=True)
+        soft_grid, hard_grid = np.meshgrid(soft_values, hard_values, indexing="ij")
+        weights = np.outer(soft_counts, hard_counts).ravel() / float(N_LEVELS ** N_QUESTIONS)
+        codes = quadrant_codes(soft_grid.ravel(), hard_grid.ravel(), rules)
+        expected = np.bincount(codes, weights=weights, minlength=len(QUADRANTS))
+
+        atlas = compute_atlas(uniform_prior(), rules)
+        shares = quadrant_share(atlas, rules.quadrant_threshold)
+        np.testing.assert_allclose([shares[name] for name in QUADRANTS], expected, atol=1e-12)
+        np.testing.assert_allclose(atlas["soft_hist"], soft_counts / len(vectors), atol=1e-12)
+
+    def test_get_atlas_caches_result(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = get_atlas(uniform_prior(), cache_dir=cache_dir)
+            self.assertEqual([name for name in os.listdir(cache_dir) if name.endswith(".tmp")], [])
+            second = get_atlas(uniform_prior(), cache_dir=cache_dir)
+        np.testing.assert_array_equal(first["quadrant_shares"], second["quadrant_shares"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""相関分析のテスト"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from archive import ROLES, save_archive
+from correlation import N_DIMS, CorrelationTracker, StreamingMoments, rebuild, submission_vectors
+
+
+def _columns(n: int = 40, seed: int = 0) -> dict:
+    """3事業所（と事業所IDなし）の繰り返し診断を時刻順に並べないアーカイブ"""
+    rng = np.random.default_rng(seed)
+    return {
+        "answers": rng.integers(1, 6, (n, 14)).astype(np.uint8),
+        "role": rng.integers(0, len(ROLES), n).astype(np.uint8),
+        "pair": np.full(n, -1, dtype=np.int64),
+        "ts": 1.7e9 + rng.permutation(n) * 3600.0,
+        "session_id": np.array([f"s{i}" for i in range(n)], dtype=str),
+        "business_type": np.array(["訪問介護"] * n, dtype=str),
+        "scale": np.array(["1拠点・10名未満"] * n, dtype=str),
+        "organization_id": np.array(["", "org-a", "org-b", "org-c"], dtype=str)[rng.integers(0, 4, n)],
+        "flags": np.zeros(n, dtype=np.uint8),
+    }
+
+
+class StreamingMomentsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.xs = np.random.default_rng(1).normal(3.0, 1.0, (200, 5))
+
+    def test_welford_matches_numpy(self):
+        moments = StreamingMoments(5)
+        for x in self.xs:
+            moments.update(x)
+        np.testing.assert_allclose(moments.mean, self.xs.mean(axis=0))
+        np.testing.assert_allclose(moments.covariance(), np.cov(self.xs, rowvar=False))
+
+    def test_batch_merge_matches_sequential(self):
+        sequential = StreamingMoments(5)
+        for x in self.xs:
+            sequential.update(x)
+        merged = StreamingMoments(5)
+        for batch in np.array_split(self.xs, [1, 30, 31, 120]):
+            merged.update_batch(batch)
+        merged.update_batch(self.xs[:0])
+        self.assertEqual(merged.n, sequential.n)
+        np.testing.assert_allclose(merged.mean, sequential.mean)
+        np.testing.assert_allclose(merged.m2, sequential.m2)
+
+    def test_covariance_needs_two_samples(self):
+        moments = StreamingMoments(3)
+        moments.update(np.ones(3))
+        self.assertTrue(np.isnan(moments.covariance()).all())
+
+
+class CorrelationTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.archive_dir = os.path.join(self._tmp.name, "archive")
+        self.state = os.path.join(self._tmp.name, "correlation", "state.npz")
+        self.columns = _columns()
+        save_archive(self.columns, self.archive_dir)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _live(self) -> CorrelationTracker:
+        tracker = CorrelationTracker()
+        for i in np.argsort(self.columns["ts"], kind="stable"):
+            tracker.update(str(self.columns["organization_id"][i]), ROLES[self.columns["role"][i]],
+                           self.columns["answers"][i].tobytes())
+        return tracker
+
+    def test_live_and_rebuild_agree(self):
+        live = self._live()
+        rebuilt = rebuild(self.archive_dir, self.state)
+        self.assertEqual(rebuilt.counts(), live.counts())
+        self.assertGreater(live.counts()["repeat_pairs"], 0)
+        for name in ("moments", "lagged"):
+            with self.subTest(moments=name):
+                np.testing.assert_allclose(getattr(rebuilt, name).mean, getattr(live, name).mean)
+                np.testing.assert_allclose(getattr(rebuilt, name).m2, getattr(live, name).m2, atol=1e-9)
+        self.assertEqual(rebuilt._previous.keys(), live._previous.keys())
+        for key, vector in live._previous.items():
+            np.testing.assert_array_equal(rebuilt._previous[key], vector)
+
+    def test_flagged_answers_are_skipped(self):
+        tracker = CorrelationTracker()
+        tracker.update("org-a", "manager", bytes([4] * 14), flags=1)
+        self.assertEqual(tracker.counts(), {"submissions": 0, "repeat_pairs": 0, "tracked": 0})
+
+    def test_save_load_round_trip(self):
+        live = self._live()
+        live.save(self.state)
+        restored = CorrelationTracker(self.state)
+        self.assertEqual(restored.counts(), live.counts())
+        np.testing.assert_allclose(restored.correlation().to_numpy(), live.correlation().to_numpy())
+        np.testing.assert_allclose(restored.lagged_correlation(change=True).to_numpy(),
+                                   live.lagged_correlation(change=True).to_numpy())
+
+    def test_submission_vectors(self):
+        vectors = submission_vectors(np.array([[0] * 14, [5] * 14], dtype=np.uint8))
+        self.assertEqual(vectors.shape, (2, N_DIMS))
+        np.testing.assert_array_equal(vectors[0, :14], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
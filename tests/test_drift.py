@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""認識ギャップのドリフト検知のテスト"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from drift import FEATURES, N_FEATURES, GapDriftDetector, gap_features
+
+
+def _gaps(value: float) -> np.ndarray:
+    return np.full(N_FEATURES, value)
+
+
+class GapDriftDetectorTest(unittest.TestCase):
+
+    def test_single_one_point_change_does_not_alert(self):
+        detector = GapDriftDetector()
+        for _ in range(12):
+            self.assertEqual(detector.update("org", _gaps(1.0)), [])
+        self.assertEqual(detector.update("org", _gaps(2.0)), [])
+        self.assertEqual(detector.update("org", _gaps(1.0)), [])
+
+    def test_gradual_rise_alerts(self):
+        detector = GapDriftDetector()
+        for _ in range(8):
+            detector.update("org", _gaps(1.0))
+        alerts = []
+        for value in (1.5, 2.0, 2.5, 3.0):
+            alerts.extend(detector.update("org", _gaps(value)))
+        self.assertEqual({alert["feature"] for alert in alerts}, set(FEATURES))
+        self.assertTrue(all(alert["gap"] > alert["baseline"] for alert in alerts))
+
+    def test_organizations_are_independent(self):
+        detector = GapDriftDetector()
+        for _ in range(8):
+            detector.update("a", _gaps(1.0))
+        detector.update("b", _gaps(3.0))
+        self.assertEqual(detector.state("a")["features"][FEATURES[0]]["mean"], 1.0)
+        self.assertEqual(detector.state("b")["count"], 1)
+        self.assertIsNone(detector.state("c"))
+
+    def test_save_load_round_trip(self):
+        detector = GapDriftDetector()
+        rng = np.random.default_rng(0)
+        for i in range(50):
+            detector.update(f"org-{i % 7}", rng.integers(0, 5, N_FEATURES).astype(np.float64))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "drift", "state.npz")
+            detector.save(path)
+            restored = GapDriftDetector(path)
+            for i in range(7):
+                self.assertEqual(restored.state(f"org-{i}"), detector.state(f"org-{i}"))
+            # 読み込んだ状態から更新を続けても同じ結果になる
+            self.assertEqual(restored.update("org-0", _gaps(4.0)), detector.update("org-0", _gaps(4.0)))
+            restored.maybe_save(force=True)
+
+    def test_gap_features(self):
+        features = gap_features(bytes([5] * 14), bytes([2] * 14))
+        self.assertEqual(features.shape, (N_FEATURES,))
+        np.testing.assert_allclose(features[:14], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""イベントログのテスト"""
+
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+
+from event_log import EventLog, encode_record, iter_segment, replay, segment_paths
+
+
+class EventLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write_segment(self, number: int, data: bytes) -> str:
+        path = os.path.join(self.directory, f"events-{number:08d}.log")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_flush_waits_for_group_commit(self):
+        log = EventLog(self.directory, commit_interval=0.2)
+        try:
+            first = log.append("session_start", session_id="a")
+            second = log.append("session_reset", session_id="a")
+            self.assertTrue(log.flush(second, timeout=5))
+            self.assertGreaterEqual(log._committed, second)
+            self.assertEqual([event["session_id"] for event in replay(self.directory)], ["a", "a"])
+            self.assertEqual(second, first + 1)
+        finally:
+            log.close()
+
+    def test_rotation_at_segment_bytes(self):
+        log = EventLog(self.directory, segment_bytes=1, commit_interval=0.0)
+        try:
+            for i in range(3):
+                log.flush(log.append("report_view", index=i), timeout=5)
+        finally:
+            log.close()
+        # サイズを超えた時点で次のセグメントを開くため、最後のセグメントは空になる
+        paths = segment_paths(self.directory)
+        self.assertEqual([[event["index"] for event in iter_segment(path)] for path in paths],
+                         [[0], [1], [2], []])
+
+    def test_torn_tail_is_ignored(self):
+        records = [encode_record({"type": "report_view", "index": i}) for i in range(3)]
+        path = self._write_segment(1, b"".join(records[:2]) + records[2][:len(records[2]) // 2])
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual([event["index"] for event in iter_segment(path)], [0, 1])
+        self.assertEqual(stderr.getvalue(), "")
+
+    def test_corruption_before_the_tail_is_reported(self):
+        records = [encode_record({"type": "report_view", "index": i}) for i in range(3)]
+        damaged = bytearray(records[1])
+        damaged[-2] ^= 0xFF
+        path = self._write_segment(1, records[0] + bytes(damaged) + records[2])
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual([event["index"] for event in iter_segment(path)], [0])
+        self.assertIn("corrupt record", stderr.getvalue())
+
+    def test_replay_order_across_segments(self):
+        for number, indexes in ((1, [0, 1]), (2, [2]), (3, [3, 4])):
+            self._write_segment(number, b"".join(
+                encode_record({"type": "executive_submit" if i % 2 else "manager_submit", "index": i})
+                for i in indexes
+            ))
+        self.assertEqual([event["index"] for event in replay(self.directory)], [0, 1, 2, 3, 4])
+        self.assertEqual([event["index"] for event in replay(self.directory, ["manager_submit"])], [0, 2, 4])
+
+        # 既存セグメントには追記せず、新しいセグメントに続けて書く
+        log = EventLog(self.directory, commit_interval=0.0)
+        try:
+            log.flush(log.append("report_view", index=5), timeout=5)
+        finally:
+            log.close()
+        self.assertEqual(os.path.basename(segment_paths(self.directory)[-1]), "events-00000004.log")
+        self.assertEqual([event["index"] for event in replay(self.directory)], [0, 1, 2, 3, 4, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""エクスポートのテスト"""
+
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+
+import numpy as np
+
+from archive import save_archive
+from export import KEEP_EXPORTS, build_export
+
+
+def _columns() -> dict:
+    """経営者・管理者1組とシングル1件の小さなアーカイブ"""
+    answers = np.array([[4] * 14, [2] * 14, [3, 4, 5, 2, 1, 3, 4, 5, 2, 3, 4, 1, 2, 3]], dtype=np.uint8)
+    return {
+        "answers": answers,
+        "role": np.array([1, 2, 0], dtype=np.uint8),
+        "pair": np.array([-1, 0, -1], dtype=np.int64),
+        "ts": np.array([1.7e9, 1.7e9 + 60, 1.7e9 + 86400], dtype=np.float64),
+        "session_id": np.array(["a", "a", "b"], dtype=str),
+        "business_type": np.array(["訪問介護", "訪問介護", "保育園"], dtype=str),
+        "scale": np.array(["1拠点・10名未満"] * 3, dtype=str),
+        "organization_id": np.array(["", "", ""], dtype=str),
+        "flags": np.zeros(3, dtype=np.uint8),
+    }
+
+
+class BuildExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.archive_dir = os.path.join(self._tmp.name, "archive")
+        self.export_dir = os.path.join(self._tmp.name, "exports")
+        save_archive(_columns(), self.archive_dir)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_partitions(self):
+        with zipfile.ZipFile(build_export(self.archive_dir, self.export_dir)) as zf:
+            names = zf.namelist()
+        self.assertIn("diagnoses/business_type=訪問介護/date=2023-11-15/part-00000.csv", names)
+        self.assertIn("gaps/business_type=訪問介護/date=2023-11-15/part-00000.csv", names)
+        self.assertFalse(any(name.startswith("gaps/business_type=保育園") for name in names))
+
+    def test_concurrent_first_builds_share_one_file(self):
+        results, errors = [], []
+
+        def build():
+            try:
+                results.append(build_export(self.archive_dir, self.export_dir))
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=build) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(results)), 1)
+        self.assertTrue(zipfile.is_zipfile(results[0]))
+        self.assertEqual(os.listdir(self.export_dir), [os.path.basename(results[0])])
+
+    def test_old_versions_are_pruned(self):
+        paths = []
+        for i in range(KEEP_EXPORTS + 2):
+            columns = _columns()
+            columns["ts"] = columns["ts"] + i   # 内容が変わるとアーカイブの版も変わる
+            save_archive(columns, self.archive_dir)
+            paths.append(build_export(self.archive_dir, self.export_dir))
+        self.assertEqual(len(set(paths)), len(paths))
+        self.assertEqual(sorted(os.listdir(self.export_dir)),
+                         sorted(os.path.basename(path) for path in paths[-KEEP_EXPORTS:]))
+
+
+if __name__ == "__main__":
+    unittest.main()
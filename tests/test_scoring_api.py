@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""スコアリング API のリクエスト単位のテスト（ローカルにサーバを起動して実際に HTTP で送る）"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from scoring import QUESTION_IDS
+from scoring_api import DEFAULT_HOST, Coalescer, ScoringServer, _read_response, parse_item, run_benchmark
+
+
+def _answers(score: int = 4) -> dict:
+    return {qid: score for qid in QUESTION_IDS}
+
+
+class ScoringAPITest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.service = ScoringServer()
+        self.server = await self.service.start(DEFAULT_HOST, 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def request(self, method: str, path: str, payload=None, raw: bytes = None,
+                      connection=None, headers: dict = None) -> tuple:
+        reader, writer = connection or await asyncio.open_connection(DEFAULT_HOST, self.port)
+        body = raw if raw is not None else (json.dumps(payload).encode("utf-8") if payload is not None else b"")
+        extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n{extra}Content-Length: {len(body)}\r\n\r\n"
+        writer.write(head.encode("latin-1") + body)
+        status, data = await _read_response(reader)
+        if connection is None:
+            writer.close()
+        return status, data
+
+    async def test_healthz(self):
+        status, body = await self.request("GET", "/healthz")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["status"], "ok")
+
+    async def test_single_score(self):
+        status, body = await self.request("POST", "/v1/score", {"responses": _answers(5)})
+        self.assertEqual(status, 200)
+        result = json.loads(body)
+        self.assertEqual(result["soft_score"], 100.0)
+        self.assertEqual(result["quadrant"], "ホワイト優良経営")
+
+    async def test_dual_score(self):
+        status, body = await self.request("POST", "/v1/score", {"executive": _answers(5), "manager": _answers(2)})
+        self.assertEqual(status, 200)
+        gap_analysis = json.loads(body)["gap_analysis"]
+        self.assertEqual(gap_analysis["avg_gap"], 3.0)
+        self.assertEqual(gap_analysis["gaps"]["soft_1"], 3)
+
+    async def test_invalid_items_are_rejected_with_400(self):
+        cases = [
+            {"responses": [4, 4]},
+            {"responses": "4444"},
+            {"responses": None},
+            {"executive": None, "manager": _answers()},
+            {"executive": _answers()},
+            {"responses": {**_answers(), "soft_1": 4.7}},
+            {"responses": {**_answers(), "soft_1": True}},
+            {"responses": {**_answers(), "soft_1": 6}},
+            {"responses": {"unknown": 3}},
+            [],
+            {},
+        ]
+        for payload in cases:
+            with self.subTest(payload=payload):
+                status, body = await self.request("POST", "/v1/score", payload)
+                self.assertEqual(status, 400)
+                self.assertIn("error", json.loads(body))
+
+    async def test_invalid_json(self):
+        status, _ = await self.request("POST", "/v1/score", raw=b"{not json")
+        self.assertEqual(status, 400)
+
+    async def test_unknown_path_and_method(self):
+        self.assertEqual((await self.request("GET", "/v1/unknown"))[0], 404)
+        self.assertEqual((await self.request("GET", "/v1/score"))[0], 405)
+
+    async def test_batch_preserves_order(self):
+        items = [{"responses": _answers(1)}, {"executive": _answers(5), "manager": _answers(5)},
+                 {"responses": _answers(5)}]
+        status, body = await self.request("POST", "/v1/score/batch", {"items": items})
+        self.assertEqual(status, 200)
+        results = json.loads(body)["results"]
+        self.assertEqual(results[0]["quadrant"], "崩壊寸前")
+        self.assertEqual(results[1]["gap_analysis"]["avg_gap"], 0.0)
+        self.assertEqual(results[2]["quadrant"], "ホワイト優良経営")
+
+    async def test_batch_reports_failing_index(self):
+        items = [{"responses": _answers()}, {"responses": None}]
+        status, body = await self.request("POST", "/v1/score/batch", {"items": items})
+        self.assertEqual(status, 400)
+        self.assertIn("items[1]", json.loads(body)["error"])
+
+    async def test_batch_streaming(self):
+        items = [{"responses": _answers(1 + i % 5)} for i in range(25)]
+        status, body = await self.request("POST", "/v1/score/batch?stream=1", {"items": items})
+        self.assertEqual(status, 200)
+        lines = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+        self.assertEqual([line["index"] for line in lines], list(range(25)))
+
+    async def test_keep_alive(self):
+        connection = await asyncio.open_connection(DEFAULT_HOST, self.port)
+        for _ in range(3):
+            status, _ = await self.request("POST", "/v1/score", {"responses": _answers()}, connection=connection)
+            self.assertEqual(status, 200)
+        connection[1].close()
+
+    async def test_identical_concurrent_requests_are_coalesced(self):
+        key = parse_item({"responses": _answers(3)})
+        other = parse_item({"responses": _answers(4)})
+        coalescer = Coalescer()
+        results = await asyncio.gather(*(coalescer.score(key) for _ in range(20)), coalescer.score(other))
+        self.assertEqual(coalescer.requests, 21)
+        self.assertEqual(coalescer.computed, 2)
+        self.assertTrue(all(result == results[0] for result in results[:20]))
+        self.assertNotEqual(results[0], results[20])
+
+    async def test_export_requires_admin_token(self):
+        with mock.patch.dict(os.environ, {"WRD_ADMIN_TOKEN": "secret"}):
+            self.assertEqual((await self.request("GET", "/v1/export"))[0], 403)
+            status, _ = await self.request("GET", "/v1/export", headers={"Authorization": "Bearer wrong"})
+            self.assertEqual(status, 403)
+        with mock.patch.dict(os.environ, {"WRD_ADMIN_TOKEN": ""}):
+            self.assertEqual((await self.request("GET", "/v1/export"))[0], 403)
+
+    async def test_export_without_archive(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(os.environ, {"WRD_ADMIN_TOKEN": "secret", "WRD_ARCHIVE_DIR": directory}):
+            status, _ = await self.request("GET", "/v1/export", headers={"Authorization": "Bearer secret"})
+            self.assertEqual(status, 404)
+
+    async def test_benchmark_sends_every_request(self):
+        result = await run_benchmark(requests=10, concurrency=4, distinct=3,
+                                     batch_requests=1, batch_size=5, seed=0)
+        self.assertEqual(result["single_requests"], 10)
+        self.assertEqual(result["batch_rows"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""不注意回答スクリーニングのテスト"""
+
+import unittest
+
+import numpy as np
+
+from screening import (
+    FLAG_ALL_DEFAULT, FLAG_LOW_VARIANCE, FLAG_PAIR_IDENTICAL, FLAG_PAIR_INVERTED, FLAG_STRAIGHT_LINE,
+    screen_answers, screen_one, screen_pair, screen_pairs,
+)
+
+
+def _row(values) -> bytes:
+    return bytes(values)
+
+
+class ScreenAnswersTest(unittest.TestCase):
+
+    def test_near_uniform_sincere_answers_are_not_flagged(self):
+        cases = [
+            [4] * 13 + [5],        # 標準偏差 0.26
+            [4] * 10 + [5] * 4,    # 標準偏差 0.45
+            [4] * 12 + [3, 5],     # 標準偏差 0.38
+            [5] * 7 + [4] * 7,
+            [3] * 12 + [4, 2],
+        ]
+        for values in cases:
+            with self.subTest(values=values):
+                self.assertEqual(screen_one(_row(values)), 0)
+
+    def test_straight_line(self):
+        self.assertEqual(screen_one(_row([4] * 14)), FLAG_STRAIGHT_LINE)
+        self.assertEqual(screen_one(_row([3] * 14)), FLAG_STRAIGHT_LINE | FLAG_ALL_DEFAULT)
+        # 未回答（0）は初期値3として扱う
+        self.assertEqual(screen_one(_row([0] * 7 + [3] * 7)), FLAG_STRAIGHT_LINE | FLAG_ALL_DEFAULT)
+
+    def test_almost_untouched_form_is_low_variance(self):
+        self.assertEqual(screen_one(_row([3] * 13 + [4])), FLAG_LOW_VARIANCE)
+        self.assertEqual(screen_one(_row([0] * 13 + [1])), FLAG_LOW_VARIANCE)
+
+    def test_vectorized_matches_single(self):
+        rows = np.array([[4] * 13 + [5], [4] * 14, [3] * 13 + [4], [1, 2, 3, 4, 5] * 2 + [1, 2, 3, 4]],
+                        dtype=np.uint8)
+        self.assertEqual(list(screen_answers(rows)), [screen_one(bytes(row)) for row in rows])
+
+
+class ScreenPairsTest(unittest.TestCase):
+
+    def test_identical_pair(self):
+        answers = _row([4, 5, 3, 2, 4, 5, 4, 3, 4, 5, 2, 4, 3, 4])
+        self.assertEqual(screen_pair(answers, answers), FLAG_PAIR_IDENTICAL)
+
+    def test_inverted_pair(self):
+        exec_values = [4, 5, 3, 2, 4, 5, 4, 3, 4, 5, 2, 4, 1, 4]
+        self.assertEqual(screen_pair(_row(exec_values), _row([6 - v for v in exec_values])), FLAG_PAIR_INVERTED)
+
+    def test_all_default_pair_is_identical_not_inverted(self):
+        # 未回答と初期値3は同じ回答として扱う
+        self.assertEqual(screen_pair(_row([3] * 14), _row([0] * 14)), FLAG_PAIR_IDENTICAL)
+
+    def test_ordinary_pair_is_not_flagged(self):
+        exec_values = np.array([[4] * 13 + [5], [5] * 14], dtype=np.uint8)
+        mgr_values = np.array([[4] * 12 + [3, 5], [5] * 13 + [1]], dtype=np.uint8)
+        self.assertEqual(list(screen_pairs(exec_values, mgr_values)), [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()